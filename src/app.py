@@ -2,6 +2,8 @@ import os
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from .listeners import register_listeners
+from .process import start_processes
+from .utils.metrics import metrics
 
 # Tokens and secrets are all stored in environment variables
 app = App(
@@ -9,10 +11,21 @@ app = App(
     signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
 )
 
+
+# Bolt makes a WebClient per request, time the Slack calls of each one
+@app.middleware
+def instrument_slack_client(client, next):
+    metrics.wrap_slack(client)
+    next()
+
+
 # Attach listeners
 register_listeners(app)
 
 
 # Start app
 if __name__ == "__main__":
+    # Forked before the exporter thread starts, so no child inherits its lock held
+    start_processes()
+    metrics.start_exporter("app")
     SocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start()
@@ -0,0 +1,36 @@
+import asyncio
+import os
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from .listeners import register_async_listeners
+from .process import start_processes
+from .utils.metrics import metrics
+
+# Same bot as app.py on asyncio: one Socket Mode connection serves every interaction and
+# the blocking listener bodies run on a bounded thread pool (LISTENER_WORKERS)
+app = AsyncApp(
+    token=os.environ.get("SLACK_BOT_TOKEN"),
+    signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
+)
+
+
+@app.middleware
+async def instrument_slack_client(client, next):
+    metrics.wrap_async_slack(client)
+    await next()
+
+
+# Attach listeners
+register_async_listeners(app)
+
+
+async def main():
+    # Forked before the exporter thread starts, so no child inherits its lock held
+    start_processes()
+    metrics.start_exporter("app")
+    await AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start_async()
+
+
+# Start app
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,321 @@
+import threading
+import time
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pygsheets
+from pygsheets import Cell
+
+# Start and end (1 indexed, inclusive, None = open) of a range like "A:C" or "B2:D3"
+Bounds = Tuple[Tuple[Optional[int], Optional[int]], Tuple[Optional[int], Optional[int]]]
+
+
+class FakeRequest:
+    def __init__(self, method: str, run: Callable):
+        self.method = method
+        self.run = run
+
+
+class FakeSheetAPI:
+    """Stands in for pygsheets' SheetAPIWrapper (client.sheet).
+
+    Every call, including the ones made by worksheets, goes through _execute_requests
+    like it does in pygsheets, so wrappers such as sheets_quota see fake calls the same
+    way they see real ones. Each call sleeps for latency seconds and is counted by
+    API method name.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.check = True
+        self.spreadsheets: Dict[str, "FakeSpreadsheet"] = {}
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def _execute_requests(self, request: FakeRequest):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[request.method] += 1
+            return request.run()
+
+    def request(self, method: str, run: Callable):
+        return self._execute_requests(FakeRequest(method, run))
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+    def values_batch_get(self, spreadsheet_id: str, value_ranges: List[str], **kwargs):
+        spreadsheet = self.spreadsheets[spreadsheet_id]
+
+        def run():
+            value_ranges_response = []
+            for value_range in value_ranges:
+                title, bounds = spreadsheet.parse_range(value_range)
+                values = spreadsheet.worksheet(title).read(bounds)
+                value_ranges_response.append({"range": value_range, "values": values})
+            return value_ranges_response
+
+        return self.request("values.batchGet", run)
+
+    # Appends after the last row with values, like insertDataOption=OVERWRITE
+    def values_append(self, spreadsheet_id: str, values: List[List], major_dimension: str, range: str, **kwargs):
+        spreadsheet = self.spreadsheets[spreadsheet_id]
+
+        def run():
+            title, ((_, start_col), _) = spreadsheet.parse_range(range)
+            worksheet = spreadsheet.worksheet(title)
+            first_row = len(worksheet.data) + 1
+            for i, entry in enumerate(values):
+                for j, value in enumerate(entry):
+                    worksheet.set(first_row + i, (start_col or 1) + j, value)
+            start = pygsheets.Address((first_row, start_col or 1)).label
+            end = pygsheets.Address(
+                (first_row + len(values) - 1, (start_col or 1) + len(values[0]) - 1)
+            ).label
+            return {"updates": {"updatedRange": f"{title}!{start}:{end}"}}
+
+        return self.request("values.append", run)
+
+    # Supports the updateCells requests the controller sends
+    def batch_update(self, spreadsheet_id: str, requests, **kwargs):
+        spreadsheet = self.spreadsheets[spreadsheet_id]
+        if isinstance(requests, dict):
+            requests = [requests]
+
+        def run():
+            for request in requests:
+                if "updateCells" not in request:
+                    raise NotImplementedError(f"Fake batchUpdate request {list(request)}")
+                update = request["updateCells"]
+                grid = update["range"]
+                worksheet = spreadsheet.worksheet_by_id(grid["sheetId"])
+                rows = update["rows"]
+                rows = rows if isinstance(rows, list) else [rows]
+                for i, entry in enumerate(rows):
+                    for j, value in enumerate(entry["values"]):
+                        # The controller nests each cell in its own list
+                        value = value[0] if isinstance(value, list) else value
+                        worksheet.set(
+                            grid["startRowIndex"] + 1 + i,
+                            grid["startColumnIndex"] + 1 + j,
+                            format_value(value["userEnteredValue"]),
+                        )
+            return {"replies": [{} for _ in requests]}
+
+        return self.request("spreadsheets.batchUpdate", run)
+
+
+# What the sheet would display for a userEnteredValue (or update_value string)
+def format_value(value) -> str:
+    if isinstance(value, dict):
+        if "boolValue" in value:
+            return str(value["boolValue"]).upper()
+        value = next(iter(value.values()))
+    value = str(value)
+    if value.upper() in ("=TRUE", "=FALSE"):
+        return value[1:].upper()
+    return value
+
+
+class FakeDataRange:
+    def __init__(self, worksheet: "FakeWorksheet", start: Tuple[int, int], end: Tuple[int, int]):
+        self.worksheet = worksheet
+        self.start_addr = start
+        self.end_addr = end
+
+    @property
+    def cells(self) -> List[List[Cell]]:
+        return self.worksheet.get_values(self.start_addr, self.end_addr, returnas="cell")
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: "FakeSpreadsheet", id: int, title: str, data: List[List[str]]):
+        self.spreadsheet = spreadsheet
+        self.id = id
+        self.index = id
+        self.title = title
+        self.data = [list(entry) for entry in data]
+        self.named_ranges: Dict[str, Tuple[Tuple[int, int], Tuple[int, int]]] = {}
+
+    @property
+    def client(self) -> FakeSheetAPI:
+        return self.spreadsheet.api
+
+    @property
+    def rows(self) -> int:
+        return max(len(self.data), 1000)
+
+    @property
+    def cols(self) -> int:
+        return max(max((len(entry) for entry in self.data), default=0), 26)
+
+    # Direct access for building test data, not counted as an API call
+    def value(self, row: int, col: int) -> str:
+        if row > len(self.data) or col > len(self.data[row - 1]):
+            return ""
+        return self.data[row - 1][col - 1]
+
+    def set(self, row: int, col: int, value):
+        while len(self.data) < row:
+            self.data.append([])
+        entry = self.data[row - 1]
+        while len(entry) < col:
+            entry.append("")
+        entry[col - 1] = format_value(value)
+
+    # Values in bounds with trailing empty cells and rows trimmed, like the API returns
+    def read(self, bounds: Bounds) -> List[List[str]]:
+        (start_row, start_col), (end_row, end_col) = bounds
+        start_row = start_row or 1
+        start_col = start_col or 1
+        end_row = len(self.data) if end_row is None else min(end_row, len(self.data))
+        values = []
+        for row in range(start_row, end_row + 1):
+            entry = self.data[row - 1]
+            last = len(entry) if end_col is None else min(end_col, len(entry))
+            values.append(entry[start_col - 1 : last])
+        for entry in values:
+            while len(entry) > 0 and entry[-1] == "":
+                entry.pop()
+        while len(values) > 0 and len(values[-1]) == 0:
+            values.pop()
+        return values
+
+    def get_named_range(self, name: str) -> FakeDataRange:
+        start, end = self.named_ranges[name]
+        return self.client.request(
+            "spreadsheets.get", lambda: FakeDataRange(self, start, end)
+        )
+
+    def get_values(
+        self,
+        start=None,
+        end=None,
+        returnas: str = "matrix",
+        majdim: str = "ROWS",
+        include_tailing_empty: bool = True,
+        include_tailing_empty_rows: bool = True,
+        grange=None,
+        **kwargs
+    ):
+        if grange is not None:
+            start, end = grange.start.index, grange.end.index
+        start = tuple(index if index else None for index in (start or (None, None)))
+        end = tuple(index if index else None for index in (end or (None, None)))
+
+        def run():
+            values = self.read((start, end))
+            width = end[1] - (start[1] or 1) + 1 if end[1] is not None else max(
+                (len(entry) for entry in values), default=0
+            )
+            if include_tailing_empty:
+                values = [entry + [""] * (width - len(entry)) for entry in values]
+            if returnas == "cell":
+                return [
+                    [
+                        Cell(((start[0] or 1) + i, (start[1] or 1) + j), value)
+                        for j, value in enumerate(entry)
+                    ]
+                    for i, entry in enumerate(values)
+                ]
+            if majdim == "COLUMNS":
+                values = [list(column) for column in zip(*values)]
+            return values
+
+        return self.client.request("values.get", run)
+
+    def cell(self, addr) -> Cell:
+        row, col = pygsheets.Address(addr).index
+        return self.client.request("values.get", lambda: Cell((row, col), self.value(row, col)))
+
+    def get_value(self, addr) -> str:
+        row, col = pygsheets.Address(addr).index
+        return self.client.request("values.get", lambda: self.value(row, col))
+
+    def get_row(self, row: int, include_tailing_empty: bool = True, **kwargs) -> List[str]:
+        def run():
+            values = self.read(((row, 1), (row, None)))
+            return values[0] if len(values) > 0 else []
+
+        return self.client.request("values.get", run)
+
+    def get_col(self, col: int, include_tailing_empty: bool = True, **kwargs) -> List[str]:
+        def run():
+            column = [self.value(row, col) for row in range(1, len(self.data) + 1)]
+            while len(column) > 0 and column[-1] == "":
+                column.pop()
+            return column
+
+        return self.client.request("values.get", run)
+
+    def update_value(self, addr, val, **kwargs):
+        row, col = pygsheets.Address(addr).index
+        return self.client.request("values.update", lambda: self.set(row, col, val))
+
+
+class FakeSpreadsheet:
+    def __init__(self, api: FakeSheetAPI, id: str):
+        self.api = api
+        self.id = id
+        self.worksheets: Dict[str, FakeWorksheet] = {}
+        api.spreadsheets[id] = self
+
+    def add_worksheet(self, title: str, data: List[List[str]]) -> FakeWorksheet:
+        worksheet = FakeWorksheet(self, len(self.worksheets), title, data)
+        self.worksheets[title] = worksheet
+        return worksheet
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        return self.worksheets[title]
+
+    def worksheet_by_id(self, id: int) -> FakeWorksheet:
+        for worksheet in self.worksheets.values():
+            if worksheet.id == id:
+                return worksheet
+        raise KeyError(id)
+
+    # Like pygsheets, answered from the metadata fetched by open_by_key
+    def worksheet_by_title(self, title: str) -> FakeWorksheet:
+        return self.worksheets[title]
+
+    def custom_request(self, request, fields, **kwargs):
+        return self.api.batch_update(self.id, request, fields=fields, **kwargs)
+
+    # "Users", "Users!A:C" or "Users!B2:D3" to (title, bounds)
+    def parse_range(self, value_range: str) -> Tuple[str, Bounds]:
+        if "!" not in value_range:
+            return value_range, ((None, None), (None, None))
+        title, cells = value_range.split("!")
+        start, end = cells.split(":")
+        return title, (self.parse_address(start), self.parse_address(end))
+
+    @staticmethod
+    def parse_address(label: str) -> Tuple[Optional[int], Optional[int]]:
+        letters = "".join(char for char in label if char.isalpha())
+        digits = "".join(char for char in label if char.isdigit())
+        col = None
+        if letters != "":
+            col = 0
+            for char in letters.upper():
+                col = col * 26 + ord(char) - ord("A") + 1
+        return (int(digits) if digits != "" else None, col)
+
+
+class FakeClient:
+    """Drop in for the pygsheets Client returned by pygsheets.authorize().
+
+    Every key opens the same in-memory spreadsheet.
+    """
+
+    def __init__(self, latency: float = 0.0, spreadsheet_id: str = "fake"):
+        self.sheet = FakeSheetAPI(latency)
+        self.spreadsheet = FakeSpreadsheet(self.sheet, spreadsheet_id)
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        return self.sheet.request("spreadsheets.get", lambda: self.spreadsheet)
@@ -0,0 +1,93 @@
+"""Memory footprint of materialized forecasts.
+
+Builds every user's AttendancePoll for a season of meetings, the way get_all_forecasts
+does, and reports the memory allocated per 10k attendances with tracemalloc. "copies"
+gives each attendance its own MeetingTime, "shared" points every user's attendance at
+one MeetingTime per meeting.
+
+    python -m src.bench.memory_benchmark --users 250,1000 --meetings 48
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from ..dataTypes.classes import Attendance, AttendancePoll, MeetingTime, User
+
+PER_ATTENDANCES = 10000
+
+
+def meeting_times(count: int) -> List[tuple]:
+    start = datetime(2023, 1, 2, 18, 30)
+    return [
+        (start + timedelta(days=2 * i), start + timedelta(days=2 * i, hours=2, minutes=30))
+        for i in range(count)
+    ]
+
+
+def build_polls(users: int, times: List[tuple], share: bool) -> dict:
+    meetings = [MeetingTime(start, end) for start, end in times]
+    polls = {}
+    for i in range(users):
+        user = User(f"member{i}@ligerbots.org", f"First{i}", f"Last{i}")
+        attendances = [
+            Attendance(
+                meetings[j] if share else MeetingTime(start, end), (i + j) % 2 == 0
+            )
+            for j, (start, end) in enumerate(times)
+        ]
+        polls[user] = AttendancePoll(attendances, user)
+    return polls
+
+
+# Bytes still allocated by what build returns
+def measure(build: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def instance_size(instance) -> int:
+    size = sys.getsizeof(instance)
+    if hasattr(instance, "__dict__"):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="250,1000", help="comma separated roster sizes")
+    parser.add_argument("--meetings", type=int, default=48, help="meetings in the season")
+    args = parser.parse_args()
+
+    times = meeting_times(args.meetings)
+    meeting = MeetingTime(*times[0])
+    user = User("member@ligerbots.org", "First", "Last")
+    print(
+        f"Instance bytes (with __dict__ if any): User {instance_size(user)}, "
+        f"MeetingTime {instance_size(meeting)}, "
+        f"Attendance {instance_size(Attendance(meeting, True))}"
+    )
+
+    print(f"{'users':>6} {'meetings':>9} {'mode':<7} {'total KiB':>10} {f'KiB/{PER_ATTENDANCES // 1000}k':>10}")
+    for users in (int(size) for size in args.users.split(",")):
+        attendances = users * args.meetings
+        for mode in ("copies", "shared"):
+            size = measure(lambda: build_polls(users, times, mode == "shared"))
+            print(
+                f"{users:>6} {args.meetings:>9} {mode:<7} {size / 1024:>10.0f} "
+                f"{size / attendances * PER_ATTENDANCES / 1024:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Offline benchmark of the attendance sheet code paths.
+
+Runs the controller against an in-memory fake spreadsheet (see fake_sheets.py) with
+synthetic rosters and reports the wall time and the number of Sheets and Slack API
+calls of each operation. No network access or credentials are needed.
+
+    python -m src.bench.sheets_benchmark --users 50,250,1000 --latency 0.05
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import pygsheets
+
+from .fake_sheets import FakeClient
+
+# Must be set before the quota module is imported, so the benchmark never shares a
+# token bucket with a running bot
+os.environ.setdefault(
+    "SHEETS_QUOTA_FILE", os.path.join(tempfile.mkdtemp(), "sheets_quota.json")
+)
+
+SPREADSHEET_KEY = "1_RjQocIi4hCZOkZhzQhN-_3efjWivihcLK0ibF29y3Q"
+MEETINGS = 48  # Three meetings a week for a season
+POLL_WINDOW = 5  # Meetings in a poll, like the "poll test" handler
+SAMPLED_POLLS = 20  # get_attendance_poll is timed over this many users
+NEW_USER_SHARE = 0.1  # Share of the Slack roster that is not in the sheet yet
+
+# pygsheets.authorize is pointed at this client while an operation runs
+_client: FakeClient = None
+
+
+def fake_authorize(*args, **kwargs) -> FakeClient:
+    return _client
+
+
+class FakeWebClient:
+    """The few Slack WebClient methods Messenger.sendPoll calls, with fixed latency."""
+
+    def __init__(self, profiles: Dict[str, dict], latency: float = 0.0):
+        self.profiles = profiles
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+
+    # Like WebClient, every method goes through api_call
+    def api_call(self, api_method: str, params: dict) -> dict:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[api_method] += 1
+        if api_method == "usergroups.users.list":
+            return {"ok": True, "users": list(self.profiles)}
+        if api_method == "users.profile.get":
+            return {"ok": True, "profile": self.profiles[params["user"]]}
+        return {"ok": True, **params}
+
+    def usergroups_users_list(self, **kwargs) -> dict:
+        return self.api_call("usergroups.users.list", kwargs)
+
+    def users_profile_get(self, **kwargs) -> dict:
+        return self.api_call("users.profile.get", kwargs)
+
+    def chat_postMessage(self, **kwargs) -> dict:
+        return self.api_call("chat.postMessage", kwargs)
+
+
+def meeting_times(start: datetime, count: int) -> List[datetime]:
+    # Monday, Wednesday and Saturday meetings, starting the day after start
+    day = (start + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    times = []
+    while len(times) < count:
+        if day.weekday() in (0, 2):
+            times.append(day.replace(hour=18, minute=30))
+        elif day.weekday() == 5:
+            times.append(day.replace(hour=9, minute=0))
+        day += timedelta(days=1)
+    return times
+
+
+# Users, Meetings, Forecast, Attendance and Status sheets laid out like the real one
+def build_spreadsheet(client: FakeClient, users: int, start: datetime, seed: int = 0):
+    from ..google.sheet_controller import MEETING_TIME_FORMAT
+
+    rng = random.Random(seed)
+    starts = meeting_times(start, MEETINGS)
+    ends = [time + timedelta(hours=2, minutes=30) for time in starts]
+
+    roster = [
+        [f"member{i}@ligerbots.org", f"First{i}", f"Last{i}"] for i in range(users)
+    ]
+    # Meetings start in column B, so their forecasts start in column D
+    # (MEETINGS_TO_FORECAST_SHIFT), after the Email, First and Last columns
+    forecast_header = ["Email", "First", "Last"] + [
+        time.strftime(MEETING_TIME_FORMAT) for time in starts
+    ]
+    forecast = [forecast_header] + [
+        entry + [rng.choice(["TRUE", "FALSE"]) for _ in range(MEETINGS)]
+        for entry in roster
+    ]
+
+    spreadsheet = client.spreadsheet
+    spreadsheet.add_worksheet("Users", [["Email", "First", "Last"]] + roster)
+    meetings = spreadsheet.add_worksheet(
+        "Meetings",
+        [
+            [""] + [time.strftime("%A") for time in starts],
+            ["Start Time"] + [time.strftime(MEETING_TIME_FORMAT) for time in starts],
+            ["End Time"] + [time.strftime(MEETING_TIME_FORMAT) for time in ends],
+        ],
+    )
+    meetings.named_ranges["Dates"] = ((2, 2), (2, MEETINGS + 1))
+    spreadsheet.add_worksheet("Forecast", forecast)
+    spreadsheet.add_worksheet("Attendance", [forecast_header])
+    spreadsheet.add_worksheet("Status", [])
+
+
+def slack_profiles(users: int) -> Dict[str, dict]:
+    # The last NEW_USER_SHARE of the roster is not in the sheet
+    members = users + int(users * NEW_USER_SHARE)
+    return {
+        f"U{i:05}": {
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "email": f"member{i}@ligerbots.org",
+        }
+        for i in range(members)
+    }
+
+
+class Benchmark:
+    def __init__(self, users: int, latency: float, slack_latency: float):
+        self.users = users
+        self.latency = latency
+        self.slack_latency = slack_latency
+        self.now = datetime.now()
+        self.results: List[dict] = []
+
+    def fresh_client(self) -> FakeClient:
+        from ..google.session import sheets_session
+
+        global _client
+        _client = FakeClient(self.latency, SPREADSHEET_KEY)
+        build_spreadsheet(_client, self.users, self.now)
+        # Controllers share the session's client, point it at the new spreadsheet. Opening
+        # it is done once per process in production, so it is not part of any operation.
+        sheets_session.reset()
+        sheets_session.spreadsheet()
+        return _client
+
+    def controller(self, snapshot_ttl):
+        from ..google.sheet_controller import AttendanceSheetController
+
+        return AttendanceSheetController(snapshot_ttl=snapshot_ttl)
+
+    # Times operation against a fresh spreadsheet. setup runs first and is not measured.
+    def measure(self, name: str, mode: str, operation: Callable, setup: Callable = None, slack=None):
+        client = self.fresh_client()
+        argument = setup() if setup is not None else None
+        client.sheet.reset_calls()
+        if slack is not None:
+            slack.calls.clear()
+
+        start = time.perf_counter()
+        operation(argument)
+        elapsed = time.perf_counter() - start
+
+        self.results.append(
+            {
+                "users": self.users,
+                "operation": name,
+                "mode": mode,
+                "seconds": elapsed,
+                "sheets_calls": client.sheet.total_calls(),
+                "slack_calls": sum(slack.calls.values()) if slack is not None else 0,
+                "calls": dict(client.sheet.calls),
+            }
+        )
+
+    def run(self):
+        from ..dataTypes.classes import Attendance, AttendancePoll, ForecastJob, User, UserReturn
+        from ..google.snapshot import DEFAULT_SNAPSHOT_TTL
+
+        sample = random.Random(1).sample(range(self.users), min(SAMPLED_POLLS, self.users))
+        sampled_users = [
+            User(f"member{i}@ligerbots.org", f"First{i}", f"Last{i}") for i in sample
+        ]
+
+        for mode, ttl in (("remote", None), ("snapshot", DEFAULT_SNAPSHOT_TTL)):
+            self.measure(
+                f"get_attendance_poll x{len(sampled_users)}",
+                mode,
+                lambda controller: [
+                    controller.get_attendance_poll(user, POLL_WINDOW, self.now)
+                    for user in sampled_users
+                ],
+                lambda: self.controller(ttl),
+            )
+            self.measure(
+                "get_all_forecasts",
+                mode,
+                lambda controller: controller.get_all_forecasts(POLL_WINDOW, self.now),
+                lambda: self.controller(ttl),
+            )
+
+            # Every user changes one meeting of their poll
+            def forecast_jobs():
+                controller = self.controller(ttl)
+                meetings = controller.get_upcoming_meetings(POLL_WINDOW - 1, self.now)
+                column = controller.translate_date_column(meetings[0].start)
+                index = controller.get_user_index()
+                jobs = {}
+                for i in range(self.users):
+                    email = f"member{i}@ligerbots.org"
+                    _, row, first, last = index.get(email)
+                    user = UserReturn(email, row, first, last)
+                    attendances = [
+                        Attendance(meeting, (i + j) % 2 == 0)
+                        for j, meeting in enumerate(meetings)
+                    ]
+                    jobs[user] = ForecastJob(AttendancePoll(attendances, user), user, column)
+                return controller, jobs
+
+            self.measure(
+                "batch_update_forecast",
+                mode,
+                lambda argument: argument[0].batch_update_forecast(argument[1]),
+                forecast_jobs,
+            )
+
+        from ..processes import messenger
+        from ..utils.fanout import METHOD_TIERS, MethodRateLimiter
+        from ..utils.profiles import profile_cache
+
+        slack = FakeWebClient(slack_profiles(self.users), self.slack_latency)
+
+        def sender():
+            # Cold profile cache, and no Slack rate limiting so only the calls are measured
+            profile_cache.cache.clear()
+            sender = messenger.Messenger(slack)
+            sender.fanout.limiters = {
+                method: MethodRateLimiter(10**9) for method in METHOD_TIERS
+            }
+            return sender
+
+        self.measure("Messenger.sendPoll", "snapshot", lambda sender: sender.sendPoll(), sender, slack)
+
+
+def print_results(results: List[dict]):
+    print(
+        f"{'users':>6}  {'operation':<28} {'mode':<9} {'wall ms':>9} {'sheets':>7} {'slack':>6}  sheets calls"
+    )
+    for result in results:
+        calls = ", ".join(f"{method}={count}" for method, count in sorted(result["calls"].items()))
+        print(
+            f"{result['users']:>6}  {result['operation']:<28} {result['mode']:<9} "
+            f"{result['seconds'] * 1000:>9.1f} {result['sheets_calls']:>7} {result['slack_calls']:>6}  {calls}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="50,250,1000", help="comma separated roster sizes")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Sheets call")
+    parser.add_argument("--slack-latency", type=float, default=0.02, help="seconds per Slack call")
+    args = parser.parse_args()
+
+    # The Sheets session authorizes through pygsheets.authorize
+    pygsheets.authorize = fake_authorize
+    from ..google import quota
+    from ..processes import messenger
+
+    # Sheets quota waits would swamp the numbers, only API calls are of interest
+    quota.sheets_quota.bucket.rate = 10**9
+    quota.sheets_quota.bucket.capacity = 10**9
+    messenger.get_slack_ids = lambda: {"MESSAGE_LIST": "S_BENCHMARK"}
+
+    results = []
+    for users in (int(size) for size in args.users.split(",")):
+        benchmark = Benchmark(users, args.latency, args.slack_latency)
+        benchmark.run()
+        results.extend(benchmark.results)
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
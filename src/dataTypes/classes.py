@@ -1,11 +1,35 @@
 from __future__ import annotations
 
-from datetime import datetime
-from typing import List, Dict, Optional
+import threading
+
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+from weakref import WeakValueDictionary
+
+
+# Poll option values hold meeting times as seconds since this epoch. Meetings are naive
+# local times, like in the sheet.
+OPTION_EPOCH = datetime(1970, 1, 1)
+
+
+# These classes use __slots__: a full season of forecasts is one Attendance per user
+# per meeting, and a __dict__ per instance would triple their size
+class Slotted:
+    __slots__ = ()
 
+    # Also restores instances pickled (e.g. in the forecast journal) before the classes
+    # had __slots__, whose state is their __dict__
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            dict_state, slot_state = state
+            state = {**(dict_state or {}), **(slot_state or {})}
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
-class UserCreate:
+
+class UserCreate(Slotted):
+    __slots__ = ("email",)
     email: str
 
     def __init__(self, email):
@@ -24,6 +48,7 @@ class UserCreate:
 
 
 class User(UserCreate):
+    __slots__ = ("first", "last")
     first: str
     last: str
 
@@ -38,6 +63,7 @@ class User(UserCreate):
 
 
 class UserReturn(User):
+    __slots__ = ("row",)
     row: int
 
     def __init__(self, email, row, first, last):
@@ -51,11 +77,41 @@ class UserReturn(User):
         return f"{base}: {self.row}"
 
 
-@dataclass
-class MeetingTime:
+# Frozen, so one instance can be shared by every poll that includes the meeting
+@dataclass(frozen=True)
+class MeetingTime(Slotted):
+    __slots__ = ("start", "end", "__weakref__")
     start: datetime
     end: datetime
 
+    # The MeetingTime of a meeting, the same instance as long as any poll holds it
+    @staticmethod
+    def shared(start: datetime, end: datetime) -> MeetingTime:
+        key = (start, end)
+        with _shared_meeting_times_lock:
+            meetingTime = _shared_meeting_times.get(key)
+            if meetingTime is None:
+                meetingTime = MeetingTime(start, end)
+                _shared_meeting_times[key] = meetingTime
+            return meetingTime
+
+    # Compact id of the meeting for poll option values: "<start>-<end>" in epoch seconds
+    def option_value(self) -> str:
+        start = int((self.start - OPTION_EPOCH).total_seconds())
+        end = int((self.end - OPTION_EPOCH).total_seconds())
+        return f"{start}-{end}"
+
+    # None if value is not an option_value(), like the "%m/%d" values of older polls
+    @staticmethod
+    def from_option_value(value: str) -> Optional[MeetingTime]:
+        start, separator, end = value.partition("-")
+        if separator == "" or not start.isdigit() or not end.isdigit():
+            return None
+        return MeetingTime.shared(
+            OPTION_EPOCH + timedelta(seconds=int(start)),
+            OPTION_EPOCH + timedelta(seconds=int(end)),
+        )
+
     def __repr__(self) -> str:
         return f"{self.title()}: {self.timeSlot()}"
 
@@ -80,8 +136,15 @@ class MeetingTime:
         return self.start.strftime("%m/%d")
 
 
-@dataclass
+_shared_meeting_times: "WeakValueDictionary[Tuple[datetime, datetime], MeetingTime]" = (
+    WeakValueDictionary()
+)
+_shared_meeting_times_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
 class MeetingSheetEntry(MeetingTime):
+    __slots__ = ("row", "column")
     row: int
     column: int
 
@@ -89,7 +152,8 @@ class MeetingSheetEntry(MeetingTime):
         return f"{(self.row, self.column)}: {super().__repr__()}"
 
 
-class Attendance:
+class Attendance(Slotted):
+    __slots__ = ("meetingTime", "attendance")
     meetingTime: MeetingTime
     attendance: bool
 
@@ -120,7 +184,8 @@ class Attendance:
         return hash(self.meetingTime.start)
 
 
-class AttendancePoll:
+class AttendancePoll(Slotted):
+    __slots__ = ("attendances", "user")
     attendances: List[Attendance]
     user: User
 
@@ -148,109 +213,45 @@ class AttendancePoll:
     @staticmethod
     def reverse_slack_poll(body: Dict, state: bool) -> List[Attendance]:
         attendances = []
-        for meetingTime in body:
-            title = meetingTime["text"]["text"]
-            raw_date = title.split("\t")[0]
-
-            raw_times = meetingTime["description"]["text"].split("➡")
-            start_time = raw_times[0].strip()
-            end_time = raw_times[1].strip()
-
-            start_time = datetime.strptime(
-                f"{datetime.now().year}/{raw_date} {start_time}", "%Y/%m/%d %I:%M %p"
-            )
-            end_time = datetime.strptime(
-                f"{datetime.now().year}/{raw_date} {end_time}", "%Y/%m/%d %I:%M %p"
-            )
-
+        for option in body:
+            meetingTime = MeetingTime.from_option_value(option["value"])
+            if meetingTime is None:
+                meetingTime = AttendancePoll.parse_option_text(option)
             attendance = Attendance(
-                MeetingTime(start_time, end_time), state
+                meetingTime, state
             )  # If entry is in state, then it is True by Slack Default
             attendances.append(attendance)
         return attendances
 
-    def generate_slack_poll(self) -> str:
-        def generate_options(self) -> Dict[str, List]:
-            options = []
-            for attendance in self.attendances:
-                options.append(
-                    {
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": attendance.meetingTime.title(),
-                        },
-                        "description": {
-                            "type": "mrkdwn",
-                            "text": attendance.meetingTime.timeSlot(),
-                        },
-                        "value": attendance.meetingTime.date(),
-                    }
-                )
-            return options
-
-        def generate_initial_options(self) -> Optional[Dict[str, List]]:
-            initial_options = []
-
-            for attendance in self.attendances:
-                if attendance.attendance:
-                    initial_options.append(
-                        {
-                            "text": {
-                                "type": "mrkdwn",
-                                "text": attendance.meetingTime.title(),
-                            },
-                            "description": {
-                                "type": "mrkdwn",
-                                "text": attendance.meetingTime.timeSlot(),
-                            },
-                            "value": attendance.meetingTime.date(),
-                        }
-                    )
-            if len(initial_options) == 0:
-                return None
-
-            return initial_options
-
-        # def generate_confirm() -> Dict[str, List]:
-        #     confirm = {
-        #         "confirm": {
-        #             "title": {
-        #                 "type": "plain_text",
-        #                 "text": "Are you sure?"
-        #             },
-        #             "text": {
-        #                 "type": "mrkdwn",
-        #                 "text": "You are about to submit your attendance for the selected days."
-        #             },
-        #             "confirm": {
-        #                 "type": "plain_text",
-        #                 "text": "Submit"
-        #             },
-        #             "deny": {
-        #                 "type": "plain_text",
-        #                 "text": "Cancel"
-        #             }
-        #         }
-        #     }
-        #     return confirm
-
-        poll = {
-            "type": "actions",
-            "elements": [
-                {
-                    "action_id": "attendance_poll",
-                    "type": "checkboxes",
-                }
-            ],
-        }
-        poll["elements"][0]["options"] = generate_options(self)
-        initial_options = generate_initial_options(self)
-
-        # Do not add initial options if there are none. Slack gets mad if you do.
-        if initial_options is not None:
-            print("Adding initial options")
-            poll["elements"][0]["initial_options"] = initial_options
-        return poll
+    # Reads the meeting back from the option's text, for polls sent before option values
+    # held the meeting times. The text has no year, so the year that puts the meeting
+    # closest to now is used (a January meeting polled in December is next year's).
+    @staticmethod
+    def parse_option_text(option: Dict, now: Optional[datetime] = None) -> MeetingTime:
+        if now is None:
+            now = datetime.now()
+        raw_date = option["text"]["text"].split("\t")[0]
+        raw_times = option["description"]["text"].split("➡")
+        start_time = raw_times[0].strip()
+        end_time = raw_times[1].strip()
+
+        def parse(year: int, time: str) -> datetime:
+            return datetime.strptime(f"{year}/{raw_date} {time}", "%Y/%m/%d %I:%M %p")
+
+        candidates = []
+        for year in (now.year - 1, now.year, now.year + 1):
+            try:
+                candidates.append(parse(year, start_time))
+            except ValueError:  # February 29th
+                continue
+        start = min(candidates, key=lambda candidate: abs(candidate - now))
+        return MeetingTime.shared(start, parse(start.year, end_time))
+
+    # Polls over the same meetings share pre-rendered options, see PollRenderer
+    def generate_slack_poll(self) -> dict:
+        from .poll_renderer import poll_renderer
+
+        return poll_renderer.render(self)
 
 
 @dataclass
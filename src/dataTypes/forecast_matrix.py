@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .classes import Attendance, AttendancePoll, MeetingTime, User
+
+
+class ForecastMatrix:
+    """Every user's forecast for every meeting as a users x meetings boolean array.
+
+    Meetings are sorted by start time. Per meeting headcounts are kept up to date, so a
+    turnout query only touches the meetings it asks about.
+    """
+
+    def __init__(self, users: List[User], meetings: List[MeetingTime], states: np.ndarray):
+        if states.shape != (len(users), len(meetings)):
+            raise ValueError(
+                f"Forecast states are {states.shape}, expected {(len(users), len(meetings))}"
+            )
+        self.users = users
+        self.meetings = meetings
+        self.states = states.astype(bool)
+        self.counts = self.states.sum(axis=0)
+
+        self.user_rows: Dict[str, int] = {}
+        for row, user in enumerate(users):
+            self.user_rows.setdefault(user.email.lower(), row)
+        self.starts = [meeting.start for meeting in meetings]
+
+    @property
+    def shape(self) -> tuple:
+        return self.states.shape
+
+    def meeting_index(self, start: datetime) -> Optional[int]:
+        index = bisect_left(self.starts, start)
+        if index == len(self.starts) or self.starts[index] != start:
+            return None
+        return index
+
+    # Meeting indexes [start, stop) of the meetings that start after begin and before end
+    def window(self, begin: datetime, end: datetime) -> range:
+        return range(bisect_right(self.starts, begin), bisect_left(self.starts, end))
+
+    def headcount(self, meeting: int) -> int:
+        return int(self.counts[meeting])
+
+    def headcounts(self, meetings: range) -> List[int]:
+        return self.counts[meetings.start : meetings.stop].tolist()
+
+    # One user's forecasts (a view, not a copy), or None if the user is not in the matrix
+    def user_forecasts(self, email: str, meetings: Optional[range] = None) -> Optional[np.ndarray]:
+        row = self.user_rows.get(email.lower())
+        if row is None:
+            return None
+        if meetings is None:
+            return self.states[row]
+        return self.states[row, meetings.start : meetings.stop]
+
+    def attendance_poll(self, email: str, meetings: range) -> Optional[AttendancePoll]:
+        forecasts = self.user_forecasts(email, meetings)
+        if forecasts is None:
+            return None
+        attendances = [
+            Attendance(self.meetings[index], state)
+            for index, state in zip(meetings, forecasts.tolist())
+        ]
+        return AttendancePoll(attendances, self.users[self.user_rows[email.lower()]])
+
+    # Keeps the matrix (and headcounts) in step with a forecast write
+    def set(self, email: str, start: datetime, state: bool) -> bool:
+        row = self.user_rows.get(email.lower())
+        meeting = self.meeting_index(start)
+        if row is None or meeting is None:
+            return False
+        if self.states[row, meeting] != state:
+            self.states[row, meeting] = state
+            self.counts[meeting] += 1 if state else -1
+        return True
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+
+from typing import List, Sequence, Tuple
+
+from cachetools import LRUCache
+
+from .classes import AttendancePoll, MeetingTime
+
+# Meeting windows whose options are kept rendered. A weekly fan-out uses one window,
+# plus shorter ones for users whose forecasts stop early.
+POLL_TEMPLATE_CACHE_SIZE = 32
+
+
+def render_option(meetingTime: MeetingTime) -> dict:
+    return {
+        "text": {
+            "type": "mrkdwn",
+            "text": meetingTime.title(),
+        },
+        "description": {
+            "type": "mrkdwn",
+            "text": meetingTime.timeSlot(),
+        },
+        # Decoded by AttendancePoll.reverse_slack_poll when the poll is clicked
+        "value": meetingTime.option_value(),
+    }
+
+
+class PollTemplate:
+    """The checkbox options of one window of meetings, rendered once.
+
+    Every poll rendered from a template shares its option dicts, so rendered polls
+    must not be modified.
+    """
+
+    def __init__(self, meetings: Tuple[MeetingTime, ...]):
+        self.meetings = meetings
+        self.options = [render_option(meetingTime) for meetingTime in meetings]
+
+    # mask[i] is whether the i-th meeting starts out checked
+    def render(self, mask: Sequence[bool]) -> dict:
+        checkboxes = {
+            "action_id": "attendance_poll",
+            "type": "checkboxes",
+            "options": self.options,
+        }
+        initial_options = [option for option, checked in zip(self.options, mask) if checked]
+        # Do not add initial options if there are none. Slack gets mad if you do.
+        if len(initial_options) > 0:
+            checkboxes["initial_options"] = initial_options
+        return {"type": "actions", "elements": [checkboxes]}
+
+
+class PollRenderer:
+    def __init__(self, maxsize: int = POLL_TEMPLATE_CACHE_SIZE):
+        self.templates = LRUCache(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def template(self, meetings: Tuple[MeetingTime, ...]) -> PollTemplate:
+        with self.lock:
+            template = self.templates.get(meetings)
+        if template is None:
+            template = PollTemplate(meetings)
+            with self.lock:
+                self.templates[meetings] = template
+        return template
+
+    def render(self, poll: AttendancePoll) -> dict:
+        meetings = tuple(attendance.meetingTime for attendance in poll.attendances)
+        mask: List[bool] = [attendance.attendance for attendance in poll.attendances]
+        return self.template(meetings).render(mask)
+
+
+poll_renderer = PollRenderer()
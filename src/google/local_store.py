@@ -0,0 +1,568 @@
+import os
+import sqlite3
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pygsheets import Cell
+
+from ..dataTypes.classes import (
+    Attendance,
+    AttendancePoll,
+    ForecastJob,
+    MeetingSheetEntry,
+    MeetingTime,
+    User,
+    UserCreate,
+    UserReturn,
+)
+from ..dataTypes.forecast_matrix import ForecastMatrix
+from .meeting_calendar import EPOCH, to_epoch
+from .sheet_controller import (
+    AttendanceSheetController,
+    MEETINGS_TO_FORECAST_SHIFT,
+    MEETING_TIME_FORMAT,
+    MEETING_TIME_FORMAT_SHORT,
+    status_date,
+)
+from .snapshot import DEFAULT_SNAPSHOT_TTL
+
+# Where the local copy of the attendance spreadsheet is kept
+LOCAL_STORE_PATH = os.environ.get("LOCAL_STORE_PATH", "data/attendance.sqlite3")
+
+# Set LOCAL_STORE=1 to answer handlers from the local store. The SheetSyncer process
+# must be running to push local writes to the sheet and pull edits made in the sheet.
+LOCAL_STORE_ENABLED = os.environ.get("LOCAL_STORE", "0") == "1"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS users ("
+    "row INTEGER PRIMARY KEY, "
+    "email TEXT NOT NULL COLLATE NOCASE, "
+    "first TEXT NOT NULL, "
+    "last TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS users_email ON users (email)",
+    # column is the Meetings sheet column, start and end are naive epoch seconds
+    "CREATE TABLE IF NOT EXISTS meetings ("
+    "column INTEGER PRIMARY KEY, "
+    "row INTEGER NOT NULL, "
+    "start REAL NOT NULL, "
+    "end REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS meetings_start ON meetings (start)",
+    # One Forecast sheet cell. dirty is 0 once the cell matches the sheet, otherwise the
+    # time of the local write that still has to be pushed.
+    "CREATE TABLE IF NOT EXISTS forecasts ("
+    "row INTEGER NOT NULL, "
+    "column INTEGER NOT NULL, "
+    "state INTEGER NOT NULL, "
+    "dirty INTEGER NOT NULL DEFAULT 0, "
+    "PRIMARY KEY (row, column))",
+    "CREATE INDEX IF NOT EXISTS forecasts_dirty ON forecasts (dirty) WHERE dirty != 0",
+    "CREATE TABLE IF NOT EXISTS status ("
+    "row INTEGER PRIMARY KEY, "
+    "date TEXT NOT NULL, "
+    "forecast INTEGER NOT NULL, "
+    "attendance INTEGER NOT NULL, "
+    "dirty INTEGER NOT NULL DEFAULT 0)",
+    "CREATE INDEX IF NOT EXISTS status_date ON status (date)",
+)
+
+
+def from_epoch(seconds: float) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class LocalAttendanceStore:
+    """SQLite copy of the attendance spreadsheet with the AttendanceSheetController interface.
+
+    Reads are indexed queries against the local database. Forecast and status writes are
+    stored locally and marked dirty. push() writes them to the sheet and pull() brings in
+    edits made in the sheet; both are run by the SheetSyncer process. Users are still
+    added straight to the sheet, because the sheet decides which row a new user gets.
+    Until a dirty cell has been pushed, the local value wins over the sheet.
+    """
+
+    def __init__(
+        self,
+        controller: AttendanceSheetController,
+        path: str = LOCAL_STORE_PATH,
+    ):
+        # pull() reads the whole sheet through the controller's snapshot
+        if controller.snapshot_ttl is None:
+            raise ValueError("LocalAttendanceStore needs a controller with a snapshot_ttl")
+        self.controller = controller
+        self.path = path
+
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+        # First start on this host, nothing to answer from yet
+        if self.is_empty():
+            self.pull()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL lets the handlers read while the syncer and batchers write
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    # One short lived connection per call, committed on success and always closed
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # The store is always current, only the controller's snapshot is dropped
+    def invalidate_snapshot(self):
+        self.controller.invalidate_snapshot()
+
+    def is_empty(self) -> bool:
+        with self._transaction() as connection:
+            return connection.execute("SELECT 1 FROM meetings LIMIT 1").fetchone() is None
+
+    # Replaces everything that is not dirty with the current contents of the sheet
+    def pull(self):
+        self.controller.invalidate_snapshot()
+        calendar = self.controller.get_calendar()
+        user_index = self.controller.get_user_index()
+
+        # Row 1 is the header. Emails are inserted as written in the sheet, the index keys
+        # are lowercased.
+        users = [
+            (row, email, first, last)
+            for email, row, first, last in user_index.users.values()
+            if row > 1
+        ]
+        meetings = [
+            (entry.column, entry.row, to_epoch(entry.start), to_epoch(entry.end))
+            for entry in calendar.entries
+        ]
+
+        snapshot = self.controller.get_snapshot()
+        forecasts = []
+        forecast_columns = [
+            entry.column + MEETINGS_TO_FORECAST_SHIFT[1] for entry in calendar.entries
+        ]
+        for row, _, _, _ in users:
+            for column in forecast_columns:
+                value = snapshot.get_value("Forecast", row, column)
+                if value != "":
+                    forecasts.append((row, column, value.upper() == "TRUE"))
+
+        status = []
+        for index, date in enumerate(snapshot.get_col("Status", 1)):
+            if date == "":
+                continue
+            row = index + 1
+            forecast_value = snapshot.get_value("Status", row, 2)
+            attendance_value = snapshot.get_value("Status", row, 3)
+            status.append(
+                (row, date, forecast_value != "FALSE", attendance_value != "FALSE")
+            )
+
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM users")
+            connection.executemany(
+                "INSERT INTO users (row, email, first, last) VALUES (?, ?, ?, ?)", users
+            )
+            connection.execute("DELETE FROM meetings")
+            connection.executemany(
+                "INSERT INTO meetings (column, row, start, end) VALUES (?, ?, ?, ?)",
+                meetings,
+            )
+            # Cells written locally since the last push keep their local value
+            connection.execute("DELETE FROM forecasts WHERE dirty = 0")
+            connection.executemany(
+                "INSERT OR IGNORE INTO forecasts (row, column, state) VALUES (?, ?, ?)",
+                forecasts,
+            )
+            connection.execute("DELETE FROM status WHERE dirty = 0")
+            connection.executemany(
+                "INSERT OR IGNORE INTO status (row, date, forecast, attendance) "
+                "VALUES (?, ?, ?, ?)",
+                status,
+            )
+
+    # Writes dirty forecasts and status rows to the sheet. Returns the number of cells
+    # that were written. Cells that changed again while they were pushed stay dirty.
+    def push(self) -> int:
+        shift = MEETINGS_TO_FORECAST_SHIFT[1]
+        with self._transaction() as connection:
+            forecasts = connection.execute(
+                "SELECT f.row, f.column, f.state, f.dirty, u.email, u.first, u.last, "
+                "m.start, m.end FROM forecasts f "
+                "JOIN users u ON u.row = f.row "
+                "JOIN meetings m ON m.column = f.column - ? "
+                "WHERE f.dirty != 0 ORDER BY f.row, f.column",
+                (shift,),
+            ).fetchall()
+            status = connection.execute(
+                "SELECT row, date, forecast, attendance, dirty FROM status WHERE dirty != 0"
+            ).fetchall()
+
+        # Split every user's dirty cells into runs of adjacent columns. The n-th run of
+        # every user goes into the n-th batch update, so each batch has one job per user.
+        rounds: List[Dict[User, Tuple[ForecastJob, list]]] = []
+        previous = None
+        for row, column, state, dirty, email, first, last, start, end in forecasts:
+            user = UserReturn(email, row, first, last)
+            attendance = Attendance(MeetingTime.shared(from_epoch(start), from_epoch(end)), bool(state))
+            if previous is not None and previous[0] == row and previous[1] == column - 1:
+                job, cells = jobs[user]
+                job.poll.attendances.append(attendance)
+                cells.append((row, column, dirty))
+            else:
+                run = 0 if previous is None or previous[0] != row else run + 1
+                if run == len(rounds):
+                    rounds.append({})
+                jobs = rounds[run]
+                jobs[user] = (
+                    ForecastJob(AttendancePoll([attendance], user), user, column),
+                    [(row, column, dirty)],
+                )
+            previous = (row, column)
+
+        written = []
+        for jobs in rounds:
+            failures = self.controller.batch_update_forecast(
+                {user: job for user, (job, _) in jobs.items()}
+            )
+            for user, (_, cells) in jobs.items():
+                if user not in failures:
+                    written.extend(cells)
+
+        status_written = []
+        for row, date, forecast, attendance, dirty in status:
+            try:
+                self.controller.set_success(
+                    datetime.strptime(date, MEETING_TIME_FORMAT_SHORT),
+                    bool(forecast),
+                    bool(attendance),
+                    row,
+                )
+                status_written.append((row, dirty))
+            except Exception as e:
+                print(f"Could not push status for {date}: {e}")
+
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE forecasts SET dirty = 0 WHERE row = ? AND column = ? AND dirty = ?",
+                written,
+            )
+            connection.executemany(
+                "UPDATE status SET dirty = 0 WHERE row = ? AND dirty = ?", status_written
+            )
+        return len(written) + len(status_written)
+
+    def pending(self) -> int:
+        with self._transaction() as connection:
+            forecasts = connection.execute(
+                "SELECT COUNT(*) FROM forecasts WHERE dirty != 0"
+            ).fetchone()[0]
+            status = connection.execute(
+                "SELECT COUNT(*) FROM status WHERE dirty != 0"
+            ).fetchone()[0]
+        return forecasts + status
+
+    @staticmethod
+    def meeting_entry(column: int, row: int, start: float, end: float) -> MeetingSheetEntry:
+        return MeetingSheetEntry(
+            start=from_epoch(start), end=from_epoch(end), row=row, column=column
+        )
+
+    # Up to count meetings that start after date, earliest first
+    def upcoming(self, date: datetime, count: int) -> List[MeetingSheetEntry]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT column, row, start, end FROM meetings "
+                "WHERE start > ? ORDER BY start LIMIT ?",
+                (to_epoch(date), count),
+            ).fetchall()
+        return [self.meeting_entry(*row) for row in rows]
+
+    # Same as MeetingCalendar.week_span
+    def week_span(self, date: datetime) -> Optional[int]:
+        week_later = to_epoch(date + timedelta(days=7))
+        with self._transaction() as connection:
+            if (
+                connection.execute(
+                    "SELECT 1 FROM meetings WHERE start > ? LIMIT 1", (week_later,)
+                ).fetchone()
+                is None
+            ):
+                return None
+            return connection.execute(
+                "SELECT COUNT(*) FROM meetings WHERE start > ? AND start <= ?",
+                (to_epoch(date), week_later),
+            ).fetchone()[0]
+
+    def get_nearest_date(self, date: datetime = datetime.now()) -> Optional[Cell]:
+        meetings = self.upcoming(date, 1)
+        if len(meetings) == 0:
+            return None
+        entry = meetings[0]
+        return Cell((entry.row, entry.column), entry.start.strftime(MEETING_TIME_FORMAT))
+
+    def get_nearest_datetime(self, date: datetime = datetime.now()) -> Optional[datetime]:
+        meetings = self.upcoming(date, 1)
+        if len(meetings) == 0:
+            return None
+        return meetings[0].start
+
+    # Note: window is inclusive (i.e. a window of 4 returns up to 5 meetings)
+    def get_upcoming_meetings(
+        self, window: int, date: datetime = datetime.now()
+    ) -> List[MeetingSheetEntry]:
+        return self.upcoming(date, window + 1)
+
+    def get_upcoming_week_meetings(
+        self, date: datetime = datetime.now()
+    ) -> List[MeetingSheetEntry]:
+        window = self.week_span(date)
+        if window is None:
+            return []
+        return self.get_upcoming_meetings(window, date)
+
+    def get_user(self, user: UserCreate) -> Optional[UserReturn]:
+        with self._transaction() as connection:
+            found = connection.execute(
+                "SELECT row, first, last FROM users WHERE email = ? ORDER BY row LIMIT 1",
+                (user.email,),
+            ).fetchone()
+        if found is None:
+            return None
+        row, first, last = found
+        return UserReturn(user.email, row, first, last)
+
+    def save_users(self, users: List[UserReturn]):
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO users (row, email, first, last) VALUES (?, ?, ?, ?)",
+                [(user.row, user.email, user.first, user.last) for user in users],
+            )
+
+    # Users are added to the sheet right away and then copied into the store
+    def add_user(self, user: User) -> UserReturn:
+        added = self.controller.add_user(user)
+        self.save_users([added])
+        return added
+
+    def lookup_or_add_user(self, user: User) -> UserReturn:
+        searched_user = self.get_user(user)
+        if searched_user is None:
+            return self.add_user(user)
+        return searched_user
+
+    def reconcile_users(
+        self, users: List[User]
+    ) -> Tuple[Dict[str, UserReturn], List[UserReturn]]:
+        found, added = self.controller.reconcile_users(users)
+        self.save_users(list(found.values()))
+        return found, added
+
+    def translate_date_column(self, date: datetime) -> Optional[int]:
+        with self._transaction() as connection:
+            found = connection.execute(
+                "SELECT column FROM meetings WHERE start = ?", (to_epoch(date),)
+            ).fetchone()
+        if found is None:
+            return None
+        return found[0] + MEETINGS_TO_FORECAST_SHIFT[1]
+
+    def get_forecast_entry(self, user: UserReturn, date: datetime) -> Optional[Cell]:
+        column = self.translate_date_column(date)
+        if column is None:
+            print("Column is None!")
+            return None
+        with self._transaction() as connection:
+            found = connection.execute(
+                "SELECT state FROM forecasts WHERE row = ? AND column = ?",
+                (user.row, column),
+            ).fetchone()
+        value = "" if found is None else str(bool(found[0])).upper()
+        return Cell((user.row, column), value)
+
+    def get_attendance_poll(
+        self, user: UserReturn, window: int, date: datetime = datetime.now()
+    ) -> Optional[AttendancePoll]:
+        user = self.get_user(user)
+        if user is None:
+            return None
+        upcoming_meetings = self.get_upcoming_meetings(window, date)
+        if len(upcoming_meetings) == 0:
+            return None
+
+        shift = MEETINGS_TO_FORECAST_SHIFT[1]
+        with self._transaction() as connection:
+            states = dict(
+                connection.execute(
+                    "SELECT column, state FROM forecasts "
+                    "WHERE row = ? AND column BETWEEN ? AND ?",
+                    (
+                        user.row,
+                        upcoming_meetings[0].column + shift,
+                        upcoming_meetings[-1].column + shift,
+                    ),
+                ).fetchall()
+            )
+
+        attendances = [
+            Attendance(meetingTime=meeting, attendance=bool(states.get(meeting.column + shift, 0)))
+            for meeting in upcoming_meetings
+        ]
+        return AttendancePoll(attendances, User(user.email, user.first, user.last))
+
+    # Stores the polls locally. They reach the sheet on the next push. Cells that already
+    # hold the polled value are left alone, so they are not pushed again.
+    def batch_update_forecast(self, jobs: Dict[User, ForecastJob]) -> Dict[User, Exception]:
+        dirty = time.time_ns()
+        cells = [
+            (job.user.row, job.starting_column + i, attendance.attendance, dirty)
+            for job in jobs.values()
+            for i, attendance in enumerate(job.poll.attendances)
+        ]
+        try:
+            with self._transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO forecasts (row, column, state, dirty) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (row, column) DO UPDATE "
+                    "SET state = excluded.state, dirty = excluded.dirty "
+                    "WHERE state != excluded.state",
+                    cells,
+                )
+        except sqlite3.Error as e:
+            return {user: e for user in jobs}
+        return {}
+
+    # Every user's poll for the window of meetings starting at the nearest one to date.
+    # Like the sheet version, a poll stops at the user's first empty forecast.
+    def get_all_forecasts(
+        self, window: int = 1, date: Optional[datetime] = datetime.now()
+    ) -> Optional[Dict[User, AttendancePoll]]:
+        if date is None:
+            date = datetime.min
+        meetings = self.upcoming(date, window)
+        if len(meetings) == 0:
+            print("NO MORE MEETINGS")
+            return None
+        window_meetings = [MeetingTime.shared(entry.start, entry.end) for entry in meetings]
+
+        shift = MEETINGS_TO_FORECAST_SHIFT[1]
+        positions = {entry.column + shift: i for i, entry in enumerate(meetings)}
+        with self._transaction() as connection:
+            users = connection.execute(
+                "SELECT row, email, first, last FROM users ORDER BY row"
+            ).fetchall()
+            cells = connection.execute(
+                "SELECT row, column, state FROM forecasts WHERE column BETWEEN ? AND ?",
+                (min(positions), max(positions)),
+            ).fetchall()
+
+        states: Dict[int, Dict[int, bool]] = {}
+        for row, column, state in cells:
+            if column in positions:
+                states.setdefault(row, {})[positions[column]] = bool(state)
+
+        forecasts: Dict[User, AttendancePoll] = {}
+        for row, email, first, last in users:
+            user = User(email, first, last)
+            user_states = states.get(row, {})
+            attendances = []
+            for i, meeting in enumerate(window_meetings):
+                if i not in user_states:
+                    break
+                attendances.append(Attendance(meeting, user_states[i]))
+            forecasts[user] = AttendancePoll(attendances=attendances, user=user)
+        return forecasts
+
+    def get_forecasts_upcoming_week(
+        self, date: datetime = datetime.now()
+    ) -> Optional[Dict[User, AttendancePoll]]:
+        window = self.week_span(date)
+        if window is None:
+            return []
+        return self.get_all_forecasts(window=window, date=date)
+
+    def get_forecast_matrix(self) -> ForecastMatrix:
+        with self._transaction() as connection:
+            users = connection.execute(
+                "SELECT row, email, first, last FROM users ORDER BY row"
+            ).fetchall()
+            meetings = connection.execute(
+                "SELECT column, start, end FROM meetings ORDER BY start"
+            ).fetchall()
+            cells = connection.execute(
+                "SELECT row, column FROM forecasts WHERE state != 0"
+            ).fetchall()
+
+        user_positions = {row: i for i, (row, _, _, _) in enumerate(users)}
+        shift = MEETINGS_TO_FORECAST_SHIFT[1]
+        meeting_positions = {column + shift: i for i, (column, _, _) in enumerate(meetings)}
+        states = np.zeros((len(users), len(meetings)), dtype=bool)
+        for row, column in cells:
+            if row in user_positions and column in meeting_positions:
+                states[user_positions[row], meeting_positions[column]] = True
+
+        return ForecastMatrix(
+            [User(email, first, last) for _, email, first, last in users],
+            [MeetingTime.shared(from_epoch(start), from_epoch(end)) for _, start, end in meetings],
+            states,
+        )
+
+    def get_success(self, date: datetime) -> tuple:
+        next_saturday = status_date(date)
+        key = next_saturday.strftime(MEETING_TIME_FORMAT_SHORT)
+
+        with self._transaction() as connection:
+            found = connection.execute(
+                "SELECT forecast, attendance FROM status WHERE date = ? ORDER BY row LIMIT 1",
+                (key,),
+            ).fetchone()
+        if found is None:
+            self.set_success(next_saturday, False, False)
+            return False, False
+        return bool(found[0]), bool(found[1])
+
+    # Stores the status locally (on a new row after the last one if the date is new).
+    # It reaches the sheet on the next push.
+    def set_success(
+        self, date: datetime, forecast_status: bool, attendance_status: bool, index=None
+    ) -> tuple:
+        key = date.strftime(MEETING_TIME_FORMAT_SHORT)
+        dirty = time.time_ns()
+        with self._transaction() as connection:
+            if index is None:
+                found = connection.execute(
+                    "SELECT row FROM status WHERE date = ? ORDER BY row LIMIT 1", (key,)
+                ).fetchone()
+                if found is None:
+                    found = connection.execute(
+                        "SELECT COALESCE(MAX(row), 0) + 1 FROM status"
+                    ).fetchone()
+                index = found[0]
+            connection.execute(
+                "INSERT OR REPLACE INTO status (row, date, forecast, attendance, dirty) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (index, key, forecast_status, attendance_status, dirty),
+            )
+        return True
+
+
+# The attendance store handlers should use: the local store when LOCAL_STORE=1,
+# otherwise a controller that reads the sheet (through a snapshot if snapshot_ttl is set).
+def open_attendance_store(snapshot_ttl: Optional[float] = None):
+    if LOCAL_STORE_ENABLED:
+        return LocalAttendanceStore(
+            AttendanceSheetController(snapshot_ttl=DEFAULT_SNAPSHOT_TTL)
+        )
+    return AttendanceSheetController(snapshot_ttl=snapshot_ttl)
@@ -0,0 +1,100 @@
+import time
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pygsheets import Cell
+
+from ..dataTypes.classes import MeetingSheetEntry
+
+# Meetings are read from the sheet as naive local times, so the epoch is naive too
+EPOCH = datetime(1970, 1, 1)
+
+# How long a calendar read straight from the sheet is reused (meetings rarely change)
+DEFAULT_CALENDAR_TTL = 300
+
+
+def to_epoch(date: datetime) -> float:
+    return (date - EPOCH).total_seconds()
+
+
+class MeetingCalendar:
+    """Sorted index of the meetings in the Meetings sheet.
+
+    starts, ends and columns are parallel lists sorted by start time, so every lookup
+    is a binary search instead of a scan (or a remote find) over the sheet. Exact start
+    times (like the ones in poll option values) are looked up in a dict.
+    """
+
+    def __init__(self, entries: List[MeetingSheetEntry], ttl: float = DEFAULT_CALENDAR_TTL):
+        self.entries = sorted(entries, key=lambda entry: entry.start)
+        self.starts = [to_epoch(entry.start) for entry in self.entries]
+        self.ends = [to_epoch(entry.end) for entry in self.entries]
+        self.columns = [entry.column for entry in self.entries]
+        self.column_by_start = dict(zip(self.starts, self.columns))
+        self.ttl = ttl
+        self.loaded_at = time.monotonic()
+
+    # Builds the calendar from the start time and end time rows of the Meetings sheet
+    @classmethod
+    def from_cells(
+        cls, start_cells: List[Cell], end_cells: List[Cell], time_format: str, ttl: float = DEFAULT_CALENDAR_TTL
+    ):
+        start_cells = [cell for cell in start_cells if len(cell.value) != 0]
+        end_cells = [cell for cell in end_cells if len(cell.value) != 0]
+        if len(start_cells) != len(end_cells):
+            raise ValueError(
+                "Spreadsheet not formatted correctly. Start and End time rows do not match in length."
+            )
+
+        entries = []
+        for start_cell, end_cell in zip(start_cells, end_cells):
+            entries.append(
+                MeetingSheetEntry(
+                    start=datetime.strptime(start_cell.value, time_format),
+                    end=datetime.strptime(end_cell.value, time_format),
+                    row=start_cell.row,
+                    column=start_cell.col,
+                )
+            )
+        return cls(entries, ttl)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    # Index of the first meeting that starts after date
+    def nearest_index(self, date: datetime) -> Optional[int]:
+        index = bisect_right(self.starts, to_epoch(date))
+        if index == len(self.starts):
+            return None
+        return index
+
+    def nearest(self, date: datetime) -> Optional[MeetingSheetEntry]:
+        index = self.nearest_index(date)
+        if index is None:
+            return None
+        return self.entries[index]
+
+    # Up to count meetings starting with the nearest one
+    def upcoming(self, date: datetime, count: int) -> List[MeetingSheetEntry]:
+        index = self.nearest_index(date)
+        if index is None:
+            return []
+        return self.entries[index : index + count]
+
+    # Number of meetings from the nearest meeting up to the nearest meeting a week later.
+    # None if either end of the week has no meeting.
+    def week_span(self, date: datetime) -> Optional[int]:
+        first = self.nearest_index(date)
+        last = self.nearest_index(date + timedelta(days=7))
+        if first is None or last is None:
+            return None
+        return last - first
+
+    # Exact start time to Meetings sheet column
+    def column_of(self, date: datetime) -> Optional[int]:
+        return self.column_by_start.get(to_epoch(date))
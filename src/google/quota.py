@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, List
+
+from googleapiclient.errors import HttpError
+
+from ..utils.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows, the bucket is then only shared between threads
+    fcntl = None
+
+# The app, SpreadsheetBatcher and Messenger all share one service account, so they share
+# one per-minute quota. The bucket state lives in this file so every process draws from it.
+SHEETS_QUOTA_FILE = os.environ.get(
+    "SHEETS_QUOTA_FILE",
+    os.path.join(tempfile.gettempdir(), "liger-sheets-quota.json"),
+)
+
+# Google Sheets allows 60 requests per minute per user (the service account)
+REQUESTS_PER_MINUTE = 60
+BURST = 10
+
+# Responses worth retrying: rate limited or a server side hiccup
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1  # seconds
+BACKOFF_CAP = 64  # seconds
+
+
+class TokenBucket:
+    """Token bucket whose state is kept in a file guarded by flock.
+
+    Every process that opens a bucket on the same path shares the same tokens.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float):
+        self.path = path
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self._thread_lock = threading.Lock()
+        self._local_state = {"tokens": capacity, "updated": time.time()}
+
+    @contextmanager
+    def _state(self):
+        with self._thread_lock:
+            if fcntl is None:
+                yield self._local_state
+                return
+
+            with open(self.path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read())
+                    except ValueError:
+                        state = {"tokens": self.capacity, "updated": time.time()}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict, now: float) -> float:
+        elapsed = max(0, now - state["updated"])
+        return min(self.capacity, state["tokens"] + elapsed * self.rate)
+
+    # Blocks until the tokens are available. Returns how long it waited.
+    def acquire(self, tokens: float = 1) -> float:
+        waited = 0
+        while True:
+            with self._state() as state:
+                now = time.time()
+                available = self._refill(state, now)
+                state["updated"] = now
+                if available >= tokens:
+                    state["tokens"] = available - tokens
+                    return waited
+                state["tokens"] = available
+                wait = (tokens - available) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def available(self) -> float:
+        with self._state() as state:
+            return self._refill(state, time.time())
+
+
+class SheetsQuota:
+    """Rate limiting and retries for every request a pygsheets client makes.
+
+    wrap() hooks the client's SheetAPIWrapper._execute_requests, which every
+    worksheet and spreadsheet call goes through.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_cap: float = BACKOFF_CAP,
+    ):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "errors": 0,
+            "throttled_seconds": 0.0,
+        }
+
+    def wrap(self, gc):
+        sheet = gc.sheet
+        execute = sheet._execute_requests
+        # Turn off pygsheets' own 429 handling (a flat 100 second sleep) and the retries of
+        # googleapiclient's execute(num_retries=...), we do both here. Their retries would
+        # skip the bucket and ignore Retry-After.
+        sheet.check = False
+        sheet.retries = 0
+        # Once per process, wrap() runs for every client and again after a fork
+        metrics.add_collector(self.metric_samples)
+
+        def _execute_requests(request):
+            return self.execute(execute, request)
+
+        sheet._execute_requests = _execute_requests
+        return gc
+
+    def execute(self, execute, request):
+        attempt = 0
+        while True:
+            self.stats["throttled_seconds"] += self.bucket.acquire()
+            self.stats["requests"] += 1
+            try:
+                return execute(request)
+            except HttpError as error:
+                status = int(error.resp.status)
+                if status not in RETRY_STATUSES or attempt >= self.max_retries:
+                    self.stats["errors"] += 1
+                    raise
+                delay = self.retry_delay(error, attempt)
+                print(f"Sheets API returned {status}, retrying in {delay:.1f}s")
+                self.stats["retries"] += 1
+                attempt += 1
+                time.sleep(delay)
+
+    # Retry-After if Google sent one, otherwise exponential backoff with full jitter
+    def retry_delay(self, error: HttpError, attempt: int) -> float:
+        retry_after = error.resp.get("retry-after")
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    # Quota usage for this process, plus the tokens left in the shared bucket
+    def usage(self) -> Dict[str, float]:
+        usage = dict(self.stats)
+        usage["tokens_available"] = self.bucket.available()
+        usage["requests_per_minute"] = self.bucket.rate * 60
+        return usage
+
+    # Gauges for metrics.add_collector. The tokens are shared by every process, so they
+    # are left to usage() instead of being summed across the exported files.
+    def metric_samples(self) -> List[tuple]:
+        return [(f"liger_sheets_quota_{name}", {}, value) for name, value in self.stats.items()]
+
+
+sheets_quota = SheetsQuota(
+    TokenBucket(SHEETS_QUOTA_FILE, REQUESTS_PER_MINUTE / 60, BURST)
+)
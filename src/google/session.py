@@ -0,0 +1,89 @@
+import os
+import threading
+
+from typing import Dict, Optional
+
+import pygsheets
+
+from .quota import sheets_quota
+from ..utils.metrics import metrics
+
+SERVICE_ACCOUNT_FILE = "config/secrets/g-service.json"
+SPREADSHEET_KEY = "1_RjQocIi4hCZOkZhzQhN-_3efjWivihcLK0ibF29y3Q"
+
+
+class _ThreadSession(threading.local):
+    pid: Optional[int] = None
+    client = None
+    spreadsheet = None
+    worksheets: Optional[Dict[str, object]] = None
+
+
+class SheetsSession:
+    """Authorized pygsheets clients shared by every controller in a process.
+
+    The service account is read once per process. Each thread gets one client (httplib2
+    connections are not thread safe), which keeps its HTTP connection alive and is reused
+    by every controller on that thread, together with the opened spreadsheet and the
+    worksheets looked up so far. A forked process starts over with its own clients.
+    """
+
+    def __init__(
+        self,
+        service_file: str = SERVICE_ACCOUNT_FILE,
+        spreadsheet_key: str = SPREADSHEET_KEY,
+    ):
+        self.service_file = service_file
+        self.spreadsheet_key = spreadsheet_key
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._credentials_pid: Optional[int] = None
+        self._local = _ThreadSession()
+
+    # Drops every client, e.g. to point the session at another spreadsheet
+    def reset(self):
+        with self._lock:
+            self._credentials = None
+            self._credentials_pid = None
+        self._local = _ThreadSession()
+
+    def _thread_session(self) -> _ThreadSession:
+        local = self._local
+        if local.pid != os.getpid():
+            local.pid = os.getpid()
+            local.client = None
+            local.spreadsheet = None
+            local.worksheets = {}
+        return local
+
+    def _authorize(self):
+        with self._lock:
+            if self._credentials_pid == os.getpid():
+                return pygsheets.authorize(custom_credentials=self._credentials)
+            client = pygsheets.authorize(service_file=self.service_file)
+            # google-auth refreshes the token of the shared credentials when it expires
+            self._credentials = getattr(client, "oauth", None)
+            self._credentials_pid = os.getpid()
+            return client
+
+    def client(self):
+        local = self._thread_session()
+        if local.client is None:
+            local.client = sheets_quota.wrap(metrics.wrap_sheets(self._authorize()))
+        return local.client
+
+    def spreadsheet(self):
+        local = self._thread_session()
+        if local.spreadsheet is None:
+            local.spreadsheet = self.client().open_by_key(self.spreadsheet_key)
+        return local.spreadsheet
+
+    # The spreadsheet metadata has every worksheet, so this does not call the API
+    def worksheet(self, title: str):
+        local = self._thread_session()
+        if title not in local.worksheets:
+            local.worksheets[title] = self.spreadsheet().worksheet_by_title(title)
+        return local.worksheets[title]
+
+
+sheets_session = SheetsSession()
@@ -1,7 +1,8 @@
+import numpy as np
 import pygsheets
 from pygsheets import DataRange, Cell, GridRange
 
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
 
 from ..dataTypes.classes import (
@@ -14,24 +15,157 @@ from ..dataTypes.classes import (
     ForecastJob,
     MeetingSheetEntry,
 )
-
-gc = pygsheets.authorize(service_file="config/secrets/g-service.json")
+from ..dataTypes.forecast_matrix import ForecastMatrix
+from .snapshot import SheetSnapshot
+from .meeting_calendar import MeetingCalendar, DEFAULT_CALENDAR_TTL
+from .user_index import UserIndex
+from .session import sheets_session
 
 
 MEETINGS_TO_FORECAST_SHIFT = (-1, 2)
 MEETING_TIME_FORMAT = "%m,%d,%Y %H:%M"
 MEETING_TIME_FORMAT_SHORT = "%m,%d,%Y"
 
+# Limits for a single spreadsheets.batchUpdate call. The API caps the request payload,
+# so large flushes are split into several calls.
+MAX_REQUESTS_PER_BATCH = 500
+MAX_CELLS_PER_BATCH = 10000
+
+
+# The Status sheet has one row per week, dated with the Saturday on or after date
+def status_date(date: datetime) -> datetime:
+    return date + timedelta((12 - date.weekday()) % 7)
+
 
 class AttendanceSheetController:
-    def __init__(self):
-        self.gc = pygsheets.authorize(service_file="config/secrets/g-service.json")
-        self.sh = self.gc.open_by_key("1_RjQocIi4hCZOkZhzQhN-_3efjWivihcLK0ibF29y3Q")
-        self.users_sheet = self.sh.worksheet_by_title("Users")
-        self.attendance_sheet = self.sh.worksheet_by_title("Attendance")
-        self.forecast_sheet = self.sh.worksheet_by_title("Forecast")
-        self.meetings_sheet = self.sh.worksheet_by_title("Meetings")
-        self.status_sheet = self.sh.worksheet_by_title("Status")
+    # snapshot_ttl turns on the in-memory snapshot. Reads are answered from a copy of the
+    # spreadsheet that is re-read at most every snapshot_ttl seconds. None = always read remote.
+    # Creating a controller does not talk to Google. The client, spreadsheet and worksheets
+    # come from the process wide sheets_session on first use.
+    def __init__(self, snapshot_ttl: Optional[float] = None):
+        self.snapshot_ttl = snapshot_ttl
+        self._snapshot: Optional[SheetSnapshot] = None
+        self._calendar: Optional[MeetingCalendar] = None
+        self._user_index: Optional[UserIndex] = None
+
+    @property
+    def gc(self):
+        return sheets_session.client()
+
+    @property
+    def sh(self):
+        return sheets_session.spreadsheet()
+
+    @property
+    def users_sheet(self):
+        return sheets_session.worksheet("Users")
+
+    @property
+    def attendance_sheet(self):
+        return sheets_session.worksheet("Attendance")
+
+    @property
+    def forecast_sheet(self):
+        return sheets_session.worksheet("Forecast")
+
+    @property
+    def meetings_sheet(self):
+        return sheets_session.worksheet("Meetings")
+
+    @property
+    def status_sheet(self):
+        return sheets_session.worksheet("Status")
+
+    # Returns the current snapshot (reloading it if it expired), or None if snapshots are off
+    def get_snapshot(self) -> Optional[SheetSnapshot]:
+        if self.snapshot_ttl is None:
+            return None
+        if self._snapshot is None or self._snapshot.expired():
+            self._snapshot = SheetSnapshot.load(
+                self.gc,
+                self.sh,
+                self.meetings_sheet.get_named_range("Dates"),
+                self.snapshot_ttl,
+            )
+        return self._snapshot
+
+    # Forces the next read to go back to Google
+    def invalidate_snapshot(self):
+        self._snapshot = None
+        self._calendar = None
+        self._user_index = None
+
+    # Sorted index of the meetings. Built from the snapshot when there is one, otherwise
+    # from a single read of the "Dates" row and the end time row below it.
+    def get_calendar(self) -> MeetingCalendar:
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            if snapshot.calendar is None:
+                start_row, start_col = snapshot.dates_start
+                end_row, end_col = snapshot.dates_end
+                rows = self.get_cells(
+                    self.meetings_sheet, (start_row, start_col), (end_row + 1, end_col)
+                )
+                snapshot.calendar = self.build_calendar(rows, snapshot.ttl)
+            return snapshot.calendar
+
+        if self._calendar is None or self._calendar.expired():
+            dates_range = self.meetings_sheet.get_named_range("Dates")
+            start_row, start_col = dates_range.start_addr
+            end_row, end_col = dates_range.end_addr
+            rows = self.get_cells(
+                self.meetings_sheet, (start_row, start_col), (end_row + 1, end_col)
+            )
+            self._calendar = self.build_calendar(rows)
+        return self._calendar
+
+    # Email to (email, row, first, last) index of the Users sheet. Built from the snapshot when
+    # there is one, otherwise from a single read of the Email/First/Last columns.
+    def get_user_index(self) -> UserIndex:
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            if snapshot.user_index is None:
+                rows = snapshot.get_matrix("Users", (1, 1), (None, 3))
+                snapshot.user_index = UserIndex(rows, snapshot.ttl)
+            return snapshot.user_index
+
+        if self._user_index is None or self._user_index.expired():
+            rows = self.users_sheet.get_values(
+                grange=GridRange.create("A:C", self.users_sheet),
+                include_tailing_empty=True,
+                include_tailing_empty_rows=False,
+                returnas="matrix",
+            )
+            self._user_index = UserIndex(rows)
+        return self._user_index
+
+    @staticmethod
+    def build_calendar(
+        rows: List[List[Cell]], ttl: float = DEFAULT_CALENDAR_TTL
+    ) -> MeetingCalendar:
+        if rows is None or len(rows) != 2:
+            raise ValueError(
+                "Spreadsheet not formatted correctly. Please check the Meetings sheet. There are no start or end rows"
+            )
+        return MeetingCalendar.from_cells(rows[0], rows[1], MEETING_TIME_FORMAT, ttl)
+
+    # Snapshot backed version of worksheet.get_values(start, end, returnas="cell")
+    def get_cells(self, worksheet, start: tuple, end: tuple) -> List[List[Cell]]:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return worksheet.get_values(
+                start, end, include_tailing_empty=False, returnas="cell"
+            )
+        matrix = snapshot.get_matrix(
+            worksheet.title, start, end, include_tailing_empty=False
+        )
+        return [
+            [
+                Cell((start[0] + row, start[1] + col), value)
+                for col, value in enumerate(entry)
+            ]
+            for row, entry in enumerate(matrix)
+        ]
 
     # Methods to convert the format of the time in the Meetings sheet to a datetime object
     @staticmethod
@@ -47,6 +181,11 @@ class AttendanceSheetController:
     # Get dates from the Meetings sheet based off of the named range "Dates"
     # IMPORTANT TO REMEMBER THIS IN SETUP OF A NEW SHEET!
     def get_dates(self) -> List[List[Cell]]:
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return self.get_cells(
+                self.meetings_sheet, snapshot.dates_start, snapshot.dates_end
+            )
         dates_range = self.meetings_sheet.get_named_range(
             "Dates",
         )
@@ -55,109 +194,82 @@ class AttendanceSheetController:
 
     # Get the nearest date to the current date
     def get_nearest_date(self, date: datetime = datetime.now()) -> Optional[Cell]:
-        dates = self.get_dates()
-        actual_dates = []
-        for cell in dates[0]:
-            if len(cell.value) == 0:
-                continue
-            date_value = datetime.strptime(cell.value, MEETING_TIME_FORMAT)
-            actual_dates.append(cell)
-            if date_value > date:
-                return cell
-        return None
+        entry = self.get_calendar().nearest(date)
+        if entry is None:
+            return None
+        return Cell(
+            (entry.row, entry.column), self.reverse_meeting_cell_time_format(entry.start)
+        )
 
     def get_nearest_datetime(
         self, date: datetime = datetime.now()
     ) -> Optional[datetime]:
-        nearest_date = self.get_nearest_date(date)
-        if nearest_date is None:
+        entry = self.get_calendar().nearest(date)
+        if entry is None:
             return None
-        return self.meeting_cell_time_format(nearest_date)
+        return entry.start
 
+    # Note: window is inclusive (i.e. a window of 4 returns up to 5 meetings)
     def get_upcoming_meetings(
         self, window: int, date: datetime = datetime.now()
     ) -> List[MeetingSheetEntry]:
-        current_date_cell = self.get_nearest_date(date)
-        if current_date_cell is None:
-            return []
-        remaining_meetings = self.meetings_sheet.get_values(
-            (current_date_cell.row, current_date_cell.col),
-            (current_date_cell.row + 1, current_date_cell.col + window),
-            include_tailing_empty=False,
-            returnas="cell",
-        )
-        if remaining_meetings is None or len(remaining_meetings) != 2:
-            raise ValueError(
-                "Spreadsheet not formatted correctly. Please check the Meetings sheet. There are no start or end rows"
-            )
-
-        if len(remaining_meetings[0]) != len(remaining_meetings[1]):
-            raise ValueError(
-                "Spreadsheet not formatted correctly. Start and End time rows do not match in length."
-            )
-
-        start_times = remaining_meetings[0]
-        end_times = remaining_meetings[1]
-        meeting_times: List[MeetingSheetEntry] = []
-
-        for x in range(len(start_times)):
-            start_time = self.meeting_cell_time_format(start_times[x])
-            end_time = self.meeting_cell_time_format(end_times[x])
-            meeting_times.append(
-                MeetingSheetEntry(
-                    start=start_time,
-                    end=end_time,
-                    column=start_times[x].col,
-                    row=start_times[x].row,
-                )
-            )
-
-        return meeting_times
+        return self.get_calendar().upcoming(date, window + 1)
 
     # Wrapper of get_upcoming_meetings to get the next week of meetings
     def get_upcoming_week_meetings(
         self, date: datetime = datetime.now()
     ) -> List[MeetingSheetEntry]:
         # Find the number of meeting entries until the next week
-        current_date_cell = self.get_nearest_date(date)
-        if current_date_cell is None:
+        window = self.get_calendar().week_span(date)
+        if window is None:
             return []
-        next_week = date + timedelta(days=7)
-        next_week_cell = self.get_nearest_date(next_week)
-        if next_week_cell is None:
-            return []
-        return self.get_upcoming_meetings(
-            next_week_cell.col - current_date_cell.col, date
-        )
+        return self.get_upcoming_meetings(window, date)
 
     def get_user(self, user: UserCreate) -> Optional[UserReturn]:
-        search = self.users_sheet.find(user.email)
-        if len(search) != 0:
-            row = search[0].row
-            first = self.users_sheet.get_value((row, 2))
-            last = self.users_sheet.get_value((row, 3))
-            return UserReturn(user.email, row, first, last)
-        return None
-        # return self.users_sheet.find(user.email, in_column=1, matchEntireCell=True)
+        found = self.get_user_index().get(user.email)
+        if found is None:
+            return None
+        _, row, first, last = found
+        return UserReturn(user.email, row, first, last)
 
     def translate_date_column(self, date: datetime) -> Optional[int]:
-        cell = self.meetings_sheet.find(date.strftime(MEETING_TIME_FORMAT))
-        if len(cell) == 0:
+        column = self.get_calendar().column_of(date)
+        if column is None:
             return None
-        return cell[0].col + MEETINGS_TO_FORECAST_SHIFT[1]
+        return column + MEETINGS_TO_FORECAST_SHIFT[1]
 
     def get_forecast_entry(self, user: UserReturn, date: datetime) -> Optional[Cell]:
         column = self.translate_date_column(date)
         if column == None:
             print("Column is None!")
             return None
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return Cell(
+                (user.row, column), snapshot.get_value("Forecast", user.row, column)
+            )
         return self.forecast_sheet.cell((user.row, column))
 
     def get_user_attendances(self, user: UserReturn) -> List:
-        return self.attendance_sheet.get_row(user.row, include_tailing_empty=False)[2:]
+        return self.get_sheet_row(self.attendance_sheet, user.row)[2:]
 
     def get_user_forecasts(self, user: UserReturn) -> List:
-        return self.forecast_sheet.get_row(user.row, include_tailing_empty=False)[2:]
+        return self.get_sheet_row(self.forecast_sheet, user.row)[2:]
+
+    def get_sheet_row(self, worksheet, row: int) -> List:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return worksheet.get_row(row, include_tailing_empty=False)
+        rows = snapshot.get_matrix(
+            worksheet.title, (row, 1), (row, None), include_tailing_empty=False
+        )
+        return rows[0] if len(rows) > 0 else []
+
+    def get_sheet_col(self, worksheet, col: int) -> List:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return worksheet.get_col(col, include_tailing_empty=False)
+        return snapshot.get_col(worksheet.title, col)
 
     def get_attendance_poll(
         self, user: UserReturn, window: int, date: datetime = datetime.now()
@@ -175,11 +287,10 @@ class AttendanceSheetController:
         first_column = upcoming_meetings[0].column + MEETINGS_TO_FORECAST_SHIFT[1]
         last_column = upcoming_meetings[-1].column + MEETINGS_TO_FORECAST_SHIFT[1]
 
-        forecast_range = self.forecast_sheet.get_values(
+        forecast_range = self.get_cells(
+            self.forecast_sheet,
             (user.row, first_column),
             (user.row, last_column),
-            include_tailing_empty=False,
-            returnas="cell",
         )
         attendances = []
         for i in range(len(upcoming_meetings)):
@@ -199,10 +310,69 @@ class AttendanceSheetController:
         return attendancePoll
 
     def add_user(self, user: User) -> UserReturn:
-        first_col = self.users_sheet.get_col(1, include_tailing_empty=False)
-        blank_row = len(first_col) + 1
-        self.users_sheet.update_row(blank_row, [user.email, user.first, user.last])
-        return self.get_user(user)
+        # Another process may have added users since the index was built.
+        # Re-read before appending so we never write over their row.
+        self.invalidate_snapshot()
+        existing_user = self.get_user(user)
+        if existing_user is not None:
+            return existing_user
+
+        return self.append_users([user])[0]
+
+    # Appends users after the last row of the Users table with values.append. Google picks
+    # the rows, so several processes can add users at the same time without overwriting
+    # each other. Keeps the user index and snapshot up to date.
+    def append_users(self, users: List[User]) -> List[UserReturn]:
+        rows = [[user.email, user.first, user.last] for user in users]
+        response = self.gc.sheet.values_append(
+            self.sh.id,
+            rows,
+            "ROWS",
+            range=f"{self.users_sheet.title}!A:C",
+            insertDataOption="OVERWRITE",
+        )
+        updated_range = response["updates"]["updatedRange"].split("!")[-1]
+        first_row = pygsheets.Address(updated_range.split(":")[0]).row
+
+        user_index = self.get_user_index()
+        snapshot = self.get_snapshot()
+        added: List[UserReturn] = []
+        for i, user in enumerate(users):
+            row = first_row + i
+            user_index.add(user.email, row, user.first, user.last)
+            if snapshot is not None:
+                for col, value in enumerate(rows[i]):
+                    snapshot.set_value("Users", row, col + 1, value)
+            added.append(UserReturn(user.email, row, user.first, user.last))
+        return added
+
+    # Makes sure every user in a roster is in the Users sheet. Reads the sheet once, appends
+    # all missing users in a single write, and returns (email -> UserReturn, added users).
+    def reconcile_users(
+        self, users: List[User]
+    ) -> Tuple[Dict[str, UserReturn], List[UserReturn]]:
+        self.invalidate_snapshot()
+        user_index = self.get_user_index()
+
+        found: Dict[str, UserReturn] = {}
+        missing: Dict[str, User] = {}
+        for user in users:
+            entry = user_index.get(user.email)
+            if entry is None:
+                missing.setdefault(user.email.lower(), user)
+            else:
+                _, row, first, last = entry
+                found[user.email] = UserReturn(user.email, row, first, last)
+
+        added: List[UserReturn] = []
+        if len(missing) > 0:
+            added = self.append_users(list(missing.values()))
+
+        for user in users:
+            if user.email not in found:
+                _, row, first, last = user_index.get(user.email)
+                found[user.email] = UserReturn(user.email, row, first, last)
+        return found, added
 
     # Both checks for user and adds user if not exist
     def lookup_or_add_user(self, user: User) -> UserReturn:
@@ -213,7 +383,7 @@ class AttendanceSheetController:
             return searched_user
 
     def get_row_of_date(self, date: datetime) -> int:
-        dates = self.status_sheet.get_col(1, include_tailing_empty=False)
+        dates = self.get_sheet_col(self.status_sheet, 1)
 
         row = None
         for index, entry in enumerate(dates):
@@ -227,11 +397,10 @@ class AttendanceSheetController:
         return row
 
     def get_success(self, date: datetime) -> tuple:
-        dates = self.status_sheet.get_col(1, include_tailing_empty=False)
+        dates = self.get_sheet_col(self.status_sheet, 1)
         row = None
 
-        td = timedelta((12 - date.weekday()) % 7)
-        next_saturday = date + td
+        next_saturday = status_date(date)
 
         row = self.get_row_of_date(next_saturday)
 
@@ -241,12 +410,15 @@ class AttendanceSheetController:
             return False, False
 
         else:
-            forecast_status = (
-                False if self.status_sheet.get_value(f"B{row}") == "FALSE" else True
-            )
-            attendance_status = (
-                False if self.status_sheet.get_value(f"C{row}") == "FALSE" else True
-            )
+            snapshot = self.get_snapshot()
+            if snapshot is not None:
+                forecast_value = snapshot.get_value("Status", row, 2)
+                attendance_value = snapshot.get_value("Status", row, 3)
+            else:
+                forecast_value = self.status_sheet.get_value(f"B{row}")
+                attendance_value = self.status_sheet.get_value(f"C{row}")
+            forecast_status = False if forecast_value == "FALSE" else True
+            attendance_status = False if attendance_value == "FALSE" else True
             return forecast_status, attendance_status
 
     def set_success(
@@ -259,6 +431,14 @@ class AttendanceSheetController:
         )
         self.status_sheet.update_value(f"B{index}", f"={forecast_status}")
         self.status_sheet.update_value(f"C{index}", f"={attendance_status}")
+
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            snapshot.set_value(
+                "Status", index, 1, date.strftime(MEETING_TIME_FORMAT_SHORT)
+            )
+            snapshot.set_value("Status", index, 2, str(forecast_status).upper())
+            snapshot.set_value("Status", index, 3, str(attendance_status).upper())
         return True
 
     ## Update the forecast sheet with the attendance poll
@@ -276,42 +456,160 @@ class AttendanceSheetController:
     #     )
     #     return True
 
-    # Custom batch update for cells
-    def batch_update_forecast(self, jobs: Dict[User, ForecastJob]):
-        # Jobs will contain a dictionary of users and their forecast jobs
+    # Builds the updateCells request that writes one user's poll into the Forecast sheet
+    def forecast_update_request(self, user: UserReturn, job: ForecastJob) -> dict:
+        column = job.starting_column
+
+        # Update the cells with the values in the poll
+        def dynamic_value_format(value: bool) -> dict:
+            return [{"userEnteredValue": {"boolValue": value}}]
+
+        # Custom request to update cells based off (https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets/batchUpdate)
+        values = [
+            dynamic_value_format(attendance.attendance)
+            for attendance in job.poll.attendances
+        ]
+
+        # Note: The index is 0 based, so the first row is 0, the second row is 1, etc.
+        # Thus we need to subtract 1 from the indexes
+        return {
+            "updateCells": {
+                "rows": {"values": values},
+                "range": {
+                    "sheetId": self.forecast_sheet.id,
+                    "startRowIndex": user.row - 1,
+                    "endRowIndex": user.row,
+                    "startColumnIndex": column - 1,
+                    "endColumnIndex": column - 1 + len(job.poll.attendances),
+                },
+                "fields": "userEnteredValue",
+            },
+        }
+
+    # Re-reads the users' Forecast rows into the snapshot with one values.batchGet
+    def refresh_forecast_rows(self, snapshot: SheetSnapshot, users: List[UserReturn]):
+        rows = sorted({user.row for user in users})
+        if len(rows) == 0:
+            return
+        value_ranges = self.gc.sheet.values_batch_get(
+            self.sh.id, [f"Forecast!{row}:{row}" for row in rows]
+        )
+        changed = False
+        for row, value_range in zip(rows, value_ranges):
+            values = value_range.get("values", [])
+            changed |= snapshot.set_row("Forecast", row, values[0] if len(values) > 0 else [])
+        if changed:
+            # Rebuilt from the refreshed rows on next use
+            snapshot.forecast_matrix = None
+
+    # Splits a job into jobs for the runs of adjacent cells that differ from the last known
+    # values in the snapshot. Without a snapshot nothing is known, so the whole job is kept.
+    def changed_forecast_jobs(self, user: UserReturn, job: ForecastJob) -> List[ForecastJob]:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return [job]
+
+        runs: List[Tuple[int, List[Attendance]]] = []
+        for i, attendance in enumerate(job.poll.attendances):
+            column = job.starting_column + i
+            known = snapshot.get_value("Forecast", user.row, column).upper()
+            if known == str(attendance.attendance).upper():
+                continue
+            if len(runs) > 0 and runs[-1][0] + len(runs[-1][1]) == column:
+                runs[-1][1].append(attendance)
+            else:
+                runs.append((column, [attendance]))
+
+        return [
+            ForecastJob(
+                poll=AttendancePoll(attendances, job.poll.user),
+                user=job.user,
+                starting_column=column,
+            )
+            for column, attendances in runs
+        ]
+
+    # Custom batch update for cells. Only cells that changed are written, every user's
+    # requests are sent in one batchUpdate (split into chunks of MAX_REQUESTS_PER_BATCH /
+    # MAX_CELLS_PER_BATCH), and users whose poll did not change are skipped.
+    # Returns the users whose update failed, mapped to the error.
+    def batch_update_forecast(self, jobs: Dict[User, ForecastJob]) -> Dict[User, Exception]:
+        # Jobs will contain a dictionary of users and their forecast jobs.
+        # A user's requests always go in the same chunk.
+        try:
+            # The snapshot can be up to snapshot_ttl old, and a cell edited by hand since
+            # it was loaded would hide a click that puts the old value back
+            snapshot = self.get_snapshot()
+            if snapshot is not None:
+                self.refresh_forecast_rows(snapshot, list(jobs))
+        except Exception as e:
+            print("Could not read the forecast rows to update:", e)
+            return {user: e for user in jobs}
+        chunks: List[List[tuple]] = [[]]
+        chunk_requests = 0
+        chunk_cells = 0
         for user, job in jobs.items():
-            column = job.starting_column
-
-            # Update the cells with the values in the poll
-            def dynamic_value_format(value: bool) -> dict:
-                return [{"userEnteredValue": {"boolValue": value}}]
-
-            # Custom request to update cells based off (https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets/batchUpdate)
-            values = [
-                dynamic_value_format(attendance.attendance)
-                for attendance in job.poll.attendances
+            changed = self.changed_forecast_jobs(user, job)
+            if len(changed) == 0:
+                continue
+            cells = sum(len(changed_job.poll.attendances) for changed_job in changed)
+            if len(chunks[-1]) > 0 and (
+                chunk_requests + len(changed) > MAX_REQUESTS_PER_BATCH
+                or chunk_cells + cells > MAX_CELLS_PER_BATCH
+            ):
+                chunks.append([])
+                chunk_requests = 0
+                chunk_cells = 0
+            requests = [
+                self.forecast_update_request(user, changed_job) for changed_job in changed
             ]
+            chunks[-1].append((user, changed, requests))
+            chunk_requests += len(requests)
+            chunk_cells += cells
 
-            # Note: The index is 0 based, so the first row is 0, the second row is 1, etc.
-            # Thus we need to subtract 1 from the indexes
-            custom_request = {
-                "updateCells": {
-                    "rows": {"values": values},
-                    "range": {
-                        "sheetId": self.forecast_sheet.id,
-                        "startRowIndex": user.row - 1,
-                        "endRowIndex": user.row,
-                        "startColumnIndex": column - 1,
-                        "endColumnIndex": column - 1 + len(job.poll.attendances),
-                    },
-                    "fields": "userEnteredValue",
-                },
-            }
-
-            # Run the custom request
-            self.sh.custom_request(custom_request, fields="replies")
-
-        return True
+        failures: Dict[User, Exception] = {}
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            try:
+                # One batchUpdate for the whole chunk
+                self.sh.custom_request(
+                    [request for _, _, requests in chunk for request in requests],
+                    fields="replies",
+                )
+                written = chunk
+            except Exception as e:
+                # A batchUpdate is all or nothing, so one bad request fails the chunk.
+                # Retry users one at a time to find out which ones are actually broken.
+                print("Batch forecast update failed, retrying per user:", e)
+                written = []
+                for user, changed, requests in chunk:
+                    try:
+                        self.sh.custom_request(requests, fields="replies")
+                        written.append((user, changed, requests))
+                    except Exception as user_error:
+                        print(f"Forecast update failed for {user}:", user_error)
+                        failures[user] = user_error
+
+            snapshot = self.get_snapshot()
+            if snapshot is not None:
+                for user, changed, _ in written:
+                    for job in changed:
+                        for i, attendance in enumerate(job.poll.attendances):
+                            snapshot.set_value(
+                                "Forecast",
+                                user.row,
+                                job.starting_column + i,
+                                str(attendance.attendance).upper(),
+                            )
+                            if snapshot.forecast_matrix is not None:
+                                snapshot.forecast_matrix.set(
+                                    user.email,
+                                    attendance.meetingTime.start,
+                                    attendance.attendance,
+                                )
+
+        return failures
 
     # Grabs the forecasts for a certain window for all users in the sheet
     def get_all_forecasts(
@@ -320,6 +618,67 @@ class AttendanceSheetController:
         window: int = 1,
         date: Optional[datetime] = datetime.now(),
     ) -> Optional[Dict[User, AttendancePoll]]:
+        forecast_sheet, user_sheet = self.get_forecast_and_user_sheets()
+
+        ROW_SHIFT = 1  # To make the row indexes match between code and real life. Currently shifts by 1 to avoid 0 indexing.
+        FORECASTS_START_COLUMN = 3  # The column where the forecasts start
+
+        forecast_sheet_header = forecast_sheet[0]
+        user_sheet_header_mapper = {header: i for i, header in enumerate(user_sheet[0])}
+        header_times = self.parse_forecast_header(forecast_sheet_header)
+
+        if date is None:
+            latest_date_index = FORECASTS_START_COLUMN
+        else:
+            latest_date = self.get_nearest_datetime(date)
+            if latest_date is None:
+                print("NO MORE MEETINGS")
+                return None
+            latest_date_index = header_times.index(latest_date)
+
+        # Resolve the window's columns to meetings. Every user shares the same MeetingTime
+        # objects. The window stops at the first column that is not a known meeting.
+        meetings = {entry.start: entry for entry in self.get_calendar().entries}
+        window_meetings: List[MeetingTime] = []
+        for i in range(latest_date_index, latest_date_index + window):
+            if i >= len(header_times) or header_times[i] is None:
+                break
+            entry = meetings.get(header_times[i])
+            if entry is None:
+                print(f"Forecast column {forecast_sheet_header[i]} is not in the Meetings sheet")
+                break
+            window_meetings.append(MeetingTime.shared(entry.start, entry.end))
+        window = len(window_meetings)
+
+        body, user_count = self.forecast_body(forecast_sheet)
+
+        window_values = body[:user_count, latest_date_index : latest_date_index + window]
+        states = np.char.upper(window_values) == "TRUE"
+        # Each user's poll stops at their first empty cell. The extra empty column ends
+        # polls without one at the window, and keeps argmax defined when the window is 0.
+        empty = np.concatenate(
+            [window_values == "", np.ones((window_values.shape[0], 1), dtype=bool)], axis=1
+        )
+        lengths = np.argmax(empty, axis=1)
+
+        forecasts: Dict[User, AttendancePoll] = {}
+        for row, (user_states, length) in enumerate(zip(states.tolist(), lengths.tolist())):
+            # Users are unique by row
+            user = self.user_from_row(user_sheet, user_sheet_header_mapper, row + ROW_SHIFT)
+            attendances = [
+                Attendance(window_meetings[i], user_states[i]) for i in range(length)
+            ]
+            forecasts[user] = AttendancePoll(attendances=attendances, user=user)
+        return forecasts
+
+    # The whole Forecast and Users sheets as matrices (from the snapshot if there is one)
+    def get_forecast_and_user_sheets(self) -> Tuple[List[List[str]], List[List[str]]]:
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            forecast_sheet = snapshot.get_matrix("Forecast")
+            user_sheet = snapshot.get_matrix("Users", include_tailing_empty=False)
+            return forecast_sheet, user_sheet
+
         rang = GridRange.create(data=((0, 0), (None, None)), wks=self.forecast_sheet)
 
         # Get the entire sheet
@@ -336,152 +695,81 @@ class AttendanceSheetController:
             include_tailing_empty_rows=False,
             returnas="matrix",
         )
+        return forecast_sheet, user_sheet
 
-        meeting_range = GridRange.create(
-            data=((2, 1), (None, None)), wks=self.meetings_sheet
-        )
-        meeting_sheet = self.meetings_sheet.get_values(
-            grange=meeting_range,
-            include_tailing_empty=False,
-            include_tailing_empty_rows=False,
-            returnas="matrix",
-            majdim="COLUMNS",
-        )
-
-        forecast_sheet_header = forecast_sheet[0]
-        forecast_sheet_header_mapper = {}
-
-        user_sheet_header = user_sheet[0]
-        user_sheet_header_mapper = {}
-
-        meeting_sheet_header = meeting_sheet[0]
-        meeting_sheet_header_mapper = {}
-
-        for i, header in enumerate(forecast_sheet_header):
+    # Parse each Forecast date header once. None for headers that are not meeting times.
+    @staticmethod
+    def parse_forecast_header(header: List[str]) -> List[Optional[datetime]]:
+        header_times: List[Optional[datetime]] = []
+        for value in header:
             try:
-                time_object = datetime.strptime(header, MEETING_TIME_FORMAT)
-                header = time_object.strftime(MEETING_TIME_FORMAT_SHORT)
+                header_times.append(datetime.strptime(value, MEETING_TIME_FORMAT))
             except ValueError:
-                pass
-            forecast_sheet_header_mapper[header] = i
+                header_times.append(None)
+        return header_times
 
-        for i, header in enumerate(user_sheet_header):
-            user_sheet_header_mapper[header] = i
-
-        for i, header in enumerate(meeting_sheet_header):
-            meeting_sheet_header_mapper[header] = i
-
-        ROW_SHIFT = 1  # To make the row indexes match between code and real life. Currently shifts by 1 to avoid 0 indexing.
-        FORECASTS_START_COLUMN = 3  # The column where the forecasts start
-
-        meeting_mapper: Dict[datetime, MeetingTime] = {}
-        for row, entry in enumerate(meeting_sheet[1:]):
-            startTime_raw = entry[meeting_sheet_header_mapper["Start Time"]]
-            endTime_raw = entry[meeting_sheet_header_mapper["End Time"]]
-            print("RAW:")
-            print(startTime_raw, endTime_raw)
-            try:
-                startTime = datetime.strptime(startTime_raw, MEETING_TIME_FORMAT)
-                endTime = datetime.strptime(endTime_raw, MEETING_TIME_FORMAT)
-            except Exception as e:
-                print("FUCK ME", e)
-                startTime = datetime.strptime(startTime_raw, MEETING_TIME_FORMAT)
-                endTime = datetime.strptime(endTime_raw, MEETING_TIME_FORMAT)
-            # try:
-            #     startTime = datetime.strptime(startTime_raw, MEETING_TIME_FORMAT)
-            #     endTime = datetime.strptime(endTime_raw, MEETING_TIME_FORMAT)
-            # except Exception as e:
-            #     print(e)
-            #     try:
-            #         print(f"AGH 2: {startTime_raw}")
-            #         startTime = datetime.strptime(startTime_raw, MEETING_TIME_FORMAT_NO_LEADING_ZERO)
-            #         endTime = datetime.strptime(endTime_raw, MEETING_TIME_FORMAT_NO_LEADING_ZERO)
-            #     except:
-            #         print(f"AGH: {startTime_raw}")
-            #         startTime = datetime.strptime(startTime_raw, MEETING_TIME_FORMAT_WITH_SECONDS)
-            #         endTime = datetime.strptime(endTime_raw, MEETING_TIME_FORMAT_WITH_SECONDS)
-            meetingTime = MeetingTime(start=startTime, end=endTime)
-            meeting_mapper[startTime] = meetingTime
-
-        # Users are unique by row
-        user_mapper = {}
-        for row, entry in enumerate(user_sheet[1:]):
-            user_mapper[row + ROW_SHIFT] = User(
-                email=entry[user_sheet_header_mapper["Email"]],
-                first=entry[user_sheet_header_mapper["First"]],
-                last=entry[user_sheet_header_mapper["Last"]],
-            )
-            if user_mapper[row + ROW_SHIFT] == None:
-                del user_mapper[row + ROW_SHIFT]
-
-        forecasts: Dict[User, AttendancePoll] = {}
-
-        if date is None:
-            latest_date_index = FORECASTS_START_COLUMN
-        else:
-            latest_date_raw = self.get_nearest_date(date)
-            if latest_date_raw is None:
-                print("NO MORE MEETINGS")
-                return None
-            latest_date = datetime.strptime(latest_date_raw.value, MEETING_TIME_FORMAT)
-            print("LATEST DATE IS:", latest_date)
-            print("Forecast sheet header is:", forecast_sheet_header_mapper)
-            try:
-                latest_date_index = forecast_sheet_header_mapper[
-                    latest_date.strftime(MEETING_TIME_FORMAT_SHORT)
-                ]
-            except:
-                latest_date_index = forecast_sheet_header_mapper[
-                    latest_date.strftime(MEETING_TIME_FORMAT_SHORT)
-                ]
-
-        for row, entry in enumerate(forecast_sheet[1:]):
-            if (
-                entry[forecast_sheet_header_mapper["First"]] == ""
-                and entry[forecast_sheet_header_mapper["Last"]] == ""
-            ):
-                break
-
-            user = user_mapper[row + ROW_SHIFT]
-
-            attendances = []
-            for i in range(latest_date_index, latest_date_index + window):
-                print(i)
-                print("HEADER IS:", forecast_sheet_header[i])
-                if forecast_sheet_header[i] == "":
-                    break
-
-                date = datetime.strptime(forecast_sheet_header[i], MEETING_TIME_FORMAT)
-                # if date not in meeting_mapper:
-                #     date = datetime.strptime(
-                #         forecast_sheet_header[i], MEETING_TIME_FORMAT_SHORT_NO_LEADING_ZERO
-                #     )
-                if entry[i] == "":
-                    print("ERROR IN VALUE")
-                    break
+    # Users x columns numpy matrix of the Forecast sheet (without the header row), and the
+    # number of user rows. Users stop at the first row without a first and last name.
+    @staticmethod
+    def forecast_body(forecast_sheet: List[List[str]]) -> Tuple[np.ndarray, int]:
+        header_mapper = {header: i for i, header in enumerate(forecast_sheet[0])}
+        width = len(forecast_sheet[0])
+        body = np.array(
+            [entry + [""] * (width - len(entry)) for entry in forecast_sheet[1:]],
+            dtype=str,
+        ).reshape(-1, width)
+
+        nameless = (body[:, header_mapper["First"]] == "") & (
+            body[:, header_mapper["Last"]] == ""
+        )
+        user_count = int(np.argmax(nameless)) if nameless.any() else len(body)
+        return body, user_count
 
-                print("MEETING MAPPER IS")
-                print(meeting_mapper)
-                meetingTime = meeting_mapper[date]
-                status = True if entry[i].upper() == "TRUE" else False
-                attendance = Attendance(meetingTime, status)
-                attendances.append(attendance)
-            print("Attendances are: ", attendances)
+    @staticmethod
+    def user_from_row(user_sheet: List[List[str]], header_mapper: dict, row: int) -> User:
+        entry = user_sheet[row]
+        return User(
+            email=entry[header_mapper["Email"]],
+            first=entry[header_mapper["First"]],
+            last=entry[header_mapper["Last"]],
+        )
 
-            forecasts[user] = AttendancePoll(attendances=attendances, user=user)
-        print("COMING OUT OF GET ALL FORECASTS")
-        return forecasts
+    # Every user's forecast for every meeting in the season. Cached on the snapshot.
+    def get_forecast_matrix(self) -> ForecastMatrix:
+        snapshot = self.get_snapshot()
+        if snapshot is not None and snapshot.forecast_matrix is not None:
+            return snapshot.forecast_matrix
+
+        forecast_sheet, user_sheet = self.get_forecast_and_user_sheets()
+        header_times = self.parse_forecast_header(forecast_sheet[0])
+        body, user_count = self.forecast_body(forecast_sheet)
+
+        header_columns = {time: i for i, time in enumerate(header_times) if time is not None}
+        meetings: List[MeetingTime] = []
+        columns: List[int] = []
+        for entry in self.get_calendar().entries:
+            if entry.start in header_columns:
+                meetings.append(MeetingTime.shared(entry.start, entry.end))
+                columns.append(header_columns[entry.start])
+
+        user_sheet_header_mapper = {header: i for i, header in enumerate(user_sheet[0])}
+        users = [
+            self.user_from_row(user_sheet, user_sheet_header_mapper, row + 1)
+            for row in range(user_count)
+        ]
+        states = np.char.upper(body[:user_count][:, columns]) == "TRUE"
+
+        forecast_matrix = ForecastMatrix(users, meetings, states.reshape(user_count, len(columns)))
+        if snapshot is not None:
+            snapshot.forecast_matrix = forecast_matrix
+        return forecast_matrix
 
     def get_forecasts_upcoming_week(
         self, date: datetime = datetime.now()
     ) -> Optional[Dict[User, AttendancePoll]]:
         # Find the number of meeting entries until the next week
-        current_date_cell = self.get_nearest_date(date)
-        if current_date_cell is None:
+        window = self.get_calendar().week_span(date)
+        if window is None:
             return []
-        next_week = date + timedelta(days=7)
-        next_week_cell = self.get_nearest_date(next_week)
-
-        window = next_week_cell.col - current_date_cell.col
         print("WINDOW IS:", window)
         return self.get_all_forecasts(window=window, date=date)
@@ -0,0 +1,133 @@
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+# Worksheets that are pulled into a snapshot. Order does not matter, every title is
+# fetched in the same values.batchGet request.
+SNAPSHOT_WORKSHEETS = ("Users", "Forecast", "Meetings", "Attendance", "Status")
+
+# Default number of seconds a snapshot is trusted before it is re-read from Google
+DEFAULT_SNAPSHOT_TTL = 60
+
+
+class SheetSnapshot:
+    """In-memory copy of the attendance spreadsheet.
+
+    Every worksheet is stored as a list of rows of formatted string values (the same
+    thing pygsheets returns with returnas="matrix"). Rows and columns are 1 indexed
+    to match the spreadsheet and the rest of AttendanceSheetController.
+    """
+
+    def __init__(
+        self,
+        values: Dict[str, List[List[str]]],
+        dates_start: Tuple[int, int],
+        dates_end: Tuple[int, int],
+        ttl: float = DEFAULT_SNAPSHOT_TTL,
+    ):
+        self.values = values
+        self.dates_start = dates_start  # (row, col) of the first cell in "Dates"
+        self.dates_end = dates_end  # (row, col) of the last cell in "Dates"
+        self.ttl = ttl
+        self.loaded_at = time.monotonic()
+        self.calendar = None  # MeetingCalendar, built by the controller on first use
+        self.user_index = None  # UserIndex, built by the controller on first use
+        self.forecast_matrix = None  # ForecastMatrix, built by the controller on first use
+
+    # Reads every snapshot worksheet with a single values.batchGet call
+    @classmethod
+    def load(cls, gc, sh, dates_range, ttl: float = DEFAULT_SNAPSHOT_TTL):
+        value_ranges = gc.sheet.values_batch_get(sh.id, list(SNAPSHOT_WORKSHEETS))
+
+        values = {}
+        for title, value_range in zip(SNAPSHOT_WORKSHEETS, value_ranges):
+            values[title] = value_range.get("values", [])
+
+        return cls(values, dates_range.start_addr, dates_range.end_addr, ttl)
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    def rows(self, title: str) -> List[List[str]]:
+        return self.values[title]
+
+    # Returns "" for cells that are outside of the data the API sent back
+    def get_value(self, title: str, row: int, col: int) -> str:
+        rows = self.values[title]
+        if row < 1 or row > len(rows):
+            return ""
+        entry = rows[row - 1]
+        if col < 1 or col > len(entry):
+            return ""
+        return entry[col - 1]
+
+    def get_row(self, title: str, row: int) -> List[str]:
+        rows = self.values[title]
+        if row < 1 or row > len(rows):
+            return []
+        return list(rows[row - 1])
+
+    def get_col(self, title: str, col: int) -> List[str]:
+        column = [self.get_value(title, row, col) for row in range(1, len(self.values[title]) + 1)]
+        # Match include_tailing_empty=False
+        while len(column) > 0 and column[-1] == "":
+            column.pop()
+        return column
+
+    # Keeps the snapshot in step with writes made through the controller
+    def set_value(self, title: str, row: int, col: int, value: str):
+        rows = self.values[title]
+        while len(rows) < row:
+            rows.append([])
+        entry = rows[row - 1]
+        while len(entry) < col:
+            entry.append("")
+        entry[col - 1] = value
+
+    # Replaces a whole row with a fresh read of it. Returns whether any value changed.
+    def set_row(self, title: str, row: int, values: List[str]) -> bool:
+        rows = self.values[title]
+        while len(rows) < row:
+            rows.append([])
+        old = rows[row - 1]
+        rows[row - 1] = list(values)
+        # The API leaves off trailing empty cells, so compare without them
+        while len(old) > 0 and old[-1] == "":
+            old = old[:-1]
+        new = list(values)
+        while len(new) > 0 and new[-1] == "":
+            new.pop()
+        return old != new
+
+    # Same shape as worksheet.get_values(..., returnas="matrix") for the given area.
+    # An end of None means "to the end of the data".
+    def get_matrix(
+        self,
+        title: str,
+        start: Tuple[int, int] = (1, 1),
+        end: Tuple[Optional[int], Optional[int]] = (None, None),
+        include_tailing_empty: bool = True,
+        majdim: str = "ROWS",
+    ) -> List[List[str]]:
+        rows = self.values[title]
+        width = max((len(entry) for entry in rows), default=0)
+        end_row = len(rows) if end[0] is None else end[0]
+        end_col = width if end[1] is None else end[1]
+
+        matrix = []
+        for row in range(start[0], end_row + 1):
+            matrix.append(
+                [self.get_value(title, row, col) for col in range(start[1], end_col + 1)]
+            )
+
+        if majdim == "COLUMNS":
+            matrix = [list(column) for column in zip(*matrix)]
+
+        if not include_tailing_empty:
+            for entry in matrix:
+                while len(entry) > 0 and entry[-1] == "":
+                    entry.pop()
+        # Drop tailing empty rows like include_tailing_empty_rows=False
+        while len(matrix) > 0 and all(value == "" for value in matrix[-1]):
+            matrix.pop()
+        return matrix
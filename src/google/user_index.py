@@ -0,0 +1,39 @@
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+# How long a users index read straight from the sheet is reused. Misses always
+# trigger a re-read before a user is appended, so this only bounds name staleness.
+DEFAULT_USER_INDEX_TTL = 60
+
+
+class UserIndex:
+    """Hash index of the Users sheet from email to (email, row, first, last).
+
+    Built from a single read of the Email/First/Last columns. Emails are matched case
+    insensitively, like worksheet.find, and the email is kept as written in the sheet.
+    """
+
+    def __init__(self, rows: List[List[str]], ttl: float = DEFAULT_USER_INDEX_TTL):
+        self.users: Dict[str, Tuple[str, int, str, str]] = {}
+        for row, entry in enumerate(rows):
+            entry = list(entry) + [""] * (3 - len(entry))
+            email, first, last = entry[0], entry[1], entry[2]
+            if email == "":
+                continue
+            self.add(email, row + 1, first, last)
+        self.ttl = ttl
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    def get(self, email: str) -> Optional[Tuple[str, int, str, str]]:
+        return self.users.get(email.lower())
+
+    def add(self, email: str, row: int, first: str, last: str):
+        # Keep the first row an email appears on, same as find()[0]
+        self.users.setdefault(email.lower(), (email, row, first, last))
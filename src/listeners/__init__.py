@@ -14,3 +14,15 @@ def register_listeners(app):
     messages.register(app)
     shortcuts.register(app)
     views.register(app)
+
+
+# Registers the same listeners on an AsyncApp, see BlockingListeners
+def register_async_listeners(app, executor=None):
+    from concurrent.futures import ThreadPoolExecutor
+    from .async_adapter import BlockingListeners, LISTENER_WORKERS
+
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=LISTENER_WORKERS, thread_name_prefix="listener"
+        )
+    register_listeners(BlockingListeners(app, executor))
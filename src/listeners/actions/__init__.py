@@ -1,8 +1,9 @@
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from .sample_action import sample_action_callback
 from .attendence_poll import attendance_poll_callback
 
 
 def register(app: App):
-    app.action("sample_action_id")(sample_action_callback)
-    app.action("attendance_poll")(attendance_poll_callback)
+    app.action("sample_action_id")(track_handler(sample_action_callback))
+    app.action("attendance_poll")(track_handler(attendance_poll_callback))
@@ -13,23 +13,19 @@ from ...dataTypes.classes import (
     ForecastPayload,
     User,
 )
-from ...process import spreadsheetUpdateQueue
+from ...process import spreadsheetUpdateQueue, forecastJournal
+from ...utils.profiles import get_profile
 
 
 def attendance_poll_callback(ack: Ack, client: WebClient, body: dict, logger: Logger):
     try:
-        # Acknowledge the action; this is required by slack (https://slack.dev/bolt-python/concepts#acknowledge)
-        ack()
-
         # Get user info
         user_id = body["user"]["id"]
 
-        user_profile = client.users_profile_get(
-            user=user_id
-        )  # User profiles searchable by user id (https://api.slack.com/methods/users.profile.get)
-        first = user_profile["profile"]["first_name"]
-        last = user_profile["profile"]["last_name"]
-        email = user_profile["profile"]["email"]
+        user_profile = get_profile(client, user_id)  # Cached, see utils/profiles.py
+        first = user_profile["first_name"]
+        last = user_profile["last_name"]
+        email = user_profile["email"]
 
         # Get the state of the poll
         state_key = next(
@@ -61,8 +57,22 @@ def attendance_poll_callback(ack: Ack, client: WebClient, body: dict, logger: Lo
             poll=AttendancePoll(changed_attendance, UserCreate(email)),
             user=User(email, first, last),
         )
-        spreadsheetUpdateQueue.put(attendance_payload)  # Put data into queue
+        # Journal the update before acknowledging so it survives a crash of the batcher
+        try:
+            journal_id = forecastJournal.append(attendance_payload)
+        except Exception as e:
+            logger.error(f"Could not journal forecast update for {email}: {e}")
+            client.chat_postEphemeral(
+                channel=body["channel"]["id"],
+                user=user_id,
+                text="Sorry, your answer could not be saved. Please click it again.",
+            )
+            return
+        spreadsheetUpdateQueue.put((journal_id, attendance_payload))  # Put data into queue
         print("Sent data to child process: ", attendance_payload)
 
     except Exception as e:
         print(e)
+    finally:
+        # Acknowledge the action; this is required by slack (https://slack.dev/bolt-python/concepts#acknowledge)
+        ack()
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Callable
+
+from slack_bolt.async_app import AsyncAck, AsyncApp, AsyncRespond, AsyncSay
+from slack_sdk.web import WebClient
+from slack_sdk.web.async_client import AsyncWebClient
+
+from ..utils.metrics import metrics
+
+# Listener bodies (Sheets reads, Slack fan-outs) run on at most this many threads. The
+# event loop keeps acknowledging and queueing interactions while they are all busy.
+LISTENER_WORKERS = int(os.environ.get("LISTENER_WORKERS", "16"))
+
+
+class BlockingListeners:
+    """Registers the synchronous listeners on an AsyncApp.
+
+    Has the registration methods the listener packages call (action, command, ...), so
+    their register() functions work unchanged. Each listener runs on a bounded executor
+    with synchronous stand-ins for the async Bolt arguments: a WebClient with the same
+    token, and ack, say and respond calls that are sent through the event loop.
+
+    Actions ack themselves, so a poll click is only acknowledged once it is journaled.
+    Every other listener is acknowledged on the event loop as soon as it arrives, and
+    its own ack() calls are ignored. None of the listeners respond through ack.
+    """
+
+    def __init__(self, app: AsyncApp, executor: ThreadPoolExecutor):
+        self.app = app
+        self.executor = executor
+
+    def action(self, *args, **kwargs):
+        return self._register(self.app.action(*args, **kwargs), ack_first=False)
+
+    def command(self, *args, **kwargs):
+        return self._register(self.app.command(*args, **kwargs))
+
+    def event(self, *args, **kwargs):
+        return self._register(self.app.event(*args, **kwargs))
+
+    def message(self, *args, **kwargs):
+        return self._register(self.app.message(*args, **kwargs))
+
+    def shortcut(self, *args, **kwargs):
+        return self._register(self.app.shortcut(*args, **kwargs))
+
+    def view(self, *args, **kwargs):
+        return self._register(self.app.view(*args, **kwargs))
+
+    def _register(self, decorator: Callable, ack_first: bool = True) -> Callable:
+        def register(fn: Callable) -> Callable:
+            decorator(self.run_blocking(fn, ack_first))
+            return fn
+
+        return register
+
+    # Bolt reads the argument names through __wrapped__, so it passes the same ones
+    def run_blocking(self, fn: Callable, ack_first: bool = True) -> Callable:
+        @wraps(fn)
+        async def listener(**kwargs):
+            if ack_first:
+                for value in kwargs.values():
+                    if isinstance(value, AsyncAck):
+                        await value()
+            loop = asyncio.get_running_loop()
+            blocking_kwargs = {
+                name: to_blocking(value, loop, ack_first) for name, value in kwargs.items()
+            }
+            # Keeps the handler name the metrics tag API calls with
+            context = contextvars.copy_context()
+            await loop.run_in_executor(
+                self.executor, context.run, partial(fn, **blocking_kwargs)
+            )
+
+        return listener
+
+
+def to_blocking(value, loop: asyncio.AbstractEventLoop, acked: bool = True):
+    if isinstance(value, AsyncAck) and acked:
+        return lambda *args, **kwargs: None
+    if isinstance(value, AsyncWebClient):
+        return metrics.wrap_slack(
+            WebClient(
+                token=value.token,
+                base_url=value.base_url,
+                timeout=value.timeout,
+            )
+        )
+    if isinstance(value, (AsyncAck, AsyncSay, AsyncRespond)):
+
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(value(*args, **kwargs), loop).result()
+
+        return call
+    return value
@@ -1,10 +1,14 @@
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from . import commands
 from . import admin
 
 
 def register(app: App):
-    app.command("/chant")(commands.liger_chant)
-    app.command("/admin_schedule_message_check")(admin.schedule_message_check)
-    app.command("/admin_schedule_message")(admin.schedule_message)
-    app.command("/admin_status")(admin.status)
+    app.command("/chant")(track_handler(commands.liger_chant))
+    app.command("/admin_schedule_message_check")(track_handler(admin.schedule_message_check))
+    app.command("/admin_schedule_message")(track_handler(admin.schedule_message))
+    app.command("/admin_status")(track_handler(admin.status))
+    app.command("/admin_turnout")(track_handler(admin.turnout))
+    app.command("/admin_metrics")(track_handler(admin.metrics_report))
+    app.command("/admin_jobs")(track_handler(admin.jobs))
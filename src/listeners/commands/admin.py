@@ -4,11 +4,31 @@ from slack_bolt import Ack
 from slack_sdk import WebClient
 
 from ...utils.slack import admin_check
+from ...utils.metrics import metrics, read_textfiles
 from ...dataTypes.classes import User
+from ...google.local_store import open_attendance_store
+from ...google.quota import sheets_quota
+from ...google.snapshot import DEFAULT_SNAPSHOT_TTL
+from ...process import jobRunner
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 
+# Rows of the /admin_metrics API call table
+METRICS_REPORT_ROWS = 15
+# Jobs listed by /admin_jobs without a job id
+JOBS_REPORT_ROWS = 10
+
+# Long lived controller so turnout is answered from its snapshot instead of a sheet scan
+_sheet_controller = None
+
+
+def get_sheet_controller():
+    global _sheet_controller
+    if _sheet_controller is None:
+        _sheet_controller = open_attendance_store(snapshot_ttl=DEFAULT_SNAPSHOT_TTL)
+    return _sheet_controller
+
 
 def status(ack: Ack, client: WebClient, body: dict, logger: Logger):
     try:
@@ -62,3 +82,146 @@ def schedule_message(ack: Ack, client: WebClient, body: dict, logger: Logger):
         logger.error(e)
     # except Exception as e:
     #     logger.error(e)
+
+
+def turnout(ack: Ack, client: WebClient, body: dict, logger: Logger):
+    try:
+        ack()
+        user_id = body["user_id"]
+        if not admin_check(client, user_id):
+            return
+
+        now = datetime.now()
+        forecast_matrix = get_sheet_controller().get_forecast_matrix()
+        meetings = forecast_matrix.window(now, now + timedelta(days=7))
+
+        if len(meetings) == 0:
+            text = "No meetings in the next week! :tada:"
+        else:
+            lines = ["*Expected turnout for the next week:*"]
+            for index, count in zip(meetings, forecast_matrix.headcounts(meetings)):
+                meeting = forecast_matrix.meetings[index]
+                lines.append(f"{meeting.title()}  {meeting.timeSlot()}: *{count}*")
+            text = "\n".join(lines)
+
+        client.chat_postEphemeral(
+            channel=body["channel_id"],
+            user=body["user_id"],
+            text=text,
+        )
+    except Exception as e:
+        logger.error(e)
+
+
+# Sums of the exported metrics of every process, busiest API methods first
+def metrics_report(ack: Ack, client: WebClient, body: dict, logger: Logger):
+    try:
+        ack()
+        user_id = body["user_id"]
+        if not admin_check(client, user_id):
+            return
+
+        # Export this process now so the report includes the latest calls
+        if metrics.export_path is not None:
+            metrics.write_textfile(metrics.export_path)
+        samples = read_textfiles()
+
+        calls = {}
+        for (name, labels), value in samples.items():
+            if name in ("liger_api_calls_total", "liger_api_call_seconds_sum", "liger_api_errors_total"):
+                entry = calls.setdefault(labels, {})
+                entry[name] = value
+        rows = sorted(
+            calls.items(),
+            key=lambda item: item[1].get("liger_api_call_seconds_sum", 0),
+            reverse=True,
+        )
+
+        lines = ["*API calls by handler* (calls, errors, avg ms, total s)"]
+        for labels, entry in rows[:METRICS_REPORT_ROWS]:
+            labels = dict(labels)
+            count = entry.get("liger_api_calls_total", 0)
+            seconds = entry.get("liger_api_call_seconds_sum", 0)
+            average = seconds / count * 1000 if count > 0 else 0
+            lines.append(
+                f"`{labels.get('handler')}` {labels.get('api')} {labels.get('method')}: "
+                f"{int(count)}, {int(entry.get('liger_api_errors_total', 0))}, {average:.0f}, {seconds:.1f}"
+            )
+        if len(rows) == 0:
+            lines.append("No API calls recorded yet")
+
+        lines.append("*Forecast batchers* (queue depth, flushes, updates, last flush s)")
+        shards = {}
+        for (name, labels), value in samples.items():
+            if name.startswith("liger_batcher_") and not name.startswith("liger_batcher_flush_seconds"):
+                shards.setdefault(dict(labels).get("shard"), {})[name] = value
+        for shard, entry in sorted(shards.items()):
+            lines.append(
+                f"Shard {shard}: {int(entry.get('liger_batcher_queue_depth', 0))}, "
+                f"{int(entry.get('liger_batcher_flushes', 0))}, "
+                f"{int(entry.get('liger_batcher_updates', 0))}, "
+                f"{entry.get('liger_batcher_last_flush_seconds', 0):.2f}"
+            )
+
+        # Requests, retries and errors summed over every process. The bucket is shared, so
+        # its tokens are read here.
+        usage = sheets_quota.usage()
+        lines.append("*Sheets quota* (requests, retries, errors, throttled s, tokens left)")
+        lines.append(
+            f"{int(samples.get(('liger_sheets_quota_requests', ()), 0))}, "
+            f"{int(samples.get(('liger_sheets_quota_retries', ()), 0))}, "
+            f"{int(samples.get(('liger_sheets_quota_errors', ()), 0))}, "
+            f"{samples.get(('liger_sheets_quota_throttled_seconds', ()), 0):.1f}, "
+            f"{usage['tokens_available']:.1f} of {usage['requests_per_minute']:.0f}/min"
+        )
+
+        client.chat_postEphemeral(
+            channel=body["channel_id"],
+            user=body["user_id"],
+            text="\n".join(lines),
+        )
+    except Exception as e:
+        logger.error(e)
+
+
+def format_job(job) -> str:
+    line = f"#{job.id} {job.kind} *{job.status}*, queued {datetime.fromtimestamp(job.created):%m/%d %H:%M:%S}"
+    if job.started is not None:
+        end = job.finished if job.finished is not None else time.time()
+        line += f", ran {end - job.started:.1f}s"
+    if job.requested_by is not None:
+        line += f" by <@{job.requested_by}>"
+    text = job.result if job.result is not None else job.progress
+    if text is not None:
+        line += f": {text}"
+    return line
+
+
+# "/admin_jobs" lists the latest background jobs, "/admin_jobs <id>" shows one
+def jobs(ack: Ack, client: WebClient, body: dict, logger: Logger):
+    try:
+        ack()
+        user_id = body["user_id"]
+        if not admin_check(client, user_id):
+            return
+
+        argument = body.get("text", "").strip().lstrip("#")
+        if argument != "":
+            job = jobRunner.queue.get(int(argument)) if argument.isdigit() else None
+            text = format_job(job) if job is not None else f"No job {argument}"
+        else:
+            counts = jobRunner.queue.counts()
+            lines = [
+                "*Background jobs* "
+                + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+            ]
+            lines.extend(format_job(job) for job in jobRunner.queue.recent(JOBS_REPORT_ROWS))
+            text = "\n".join(lines)
+
+        client.chat_postEphemeral(
+            channel=body["channel_id"],
+            user=body["user_id"],
+            text=text,
+        )
+    except Exception as e:
+        logger.error(e)
@@ -1,6 +1,12 @@
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from .app_home_opened import app_home_opened_callback
+from .user_change import user_change_callback
+from .subteam_members_changed import subteam_members_changed_callback
 
 
 def register(app: App):
-    app.event("app_home_opened")(app_home_opened_callback)
+    app.event("app_home_opened")(track_handler(app_home_opened_callback))
+    app.event("user_profile_changed")(track_handler(user_change_callback))
+    app.event("user_change")(track_handler(user_change_callback))
+    app.event("subteam_members_changed")(track_handler(subteam_members_changed_callback))
@@ -0,0 +1,12 @@
+from logging import Logger
+
+from ...utils.slack import usergroup_cache
+
+
+# Someone was added to or removed from a usergroup (e.g. the admin list).
+# Drop the cached members so the next admin_check sees the change.
+def subteam_members_changed_callback(event, logger: Logger):
+    try:
+        usergroup_cache.invalidate(event["subteam_id"])
+    except Exception as e:
+        logger.error(f"Error invalidating usergroup members: {e}")
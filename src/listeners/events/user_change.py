@@ -0,0 +1,12 @@
+from logging import Logger
+
+from ...utils.profiles import profile_cache
+
+
+# Handles both user_profile_changed and user_change. Drop the cached profile so the next
+# lookup goes back to Slack.
+def user_change_callback(event, logger: Logger):
+    try:
+        profile_cache.invalidate(event["user"]["id"])
+    except Exception as e:
+        logger.error(f"Error invalidating user profile: {e}")
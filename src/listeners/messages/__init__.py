@@ -1,5 +1,6 @@
 import re
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from .messages import sayBots, attendancePoll, sendAttendancePoll
 
 # To receive messages from a channel or dm your app must be a member!
@@ -8,5 +9,5 @@ from .messages import sayBots, attendancePoll, sendAttendancePoll
 def register(app: App):
     # app.message(re.compile("Liger", re.I))(sayBots)
     # app.message(re.compile("When I say Liger you say", re.I))(sayBots)
-    app.message(re.compile("send attendance poll"))(sendAttendancePoll)
-    app.message(re.compile("poll test"))(attendancePoll)
+    app.message(re.compile("send attendance poll"))(track_handler(sendAttendancePoll))
+    app.message(re.compile("poll test"))(track_handler(attendancePoll))
@@ -3,7 +3,6 @@ from logging import Logger
 from slack_bolt import BoltContext, Say
 from slack_sdk import WebClient
 from typing import Union
-from ...google.sheet_controller import AttendanceSheetController
 
 from ...dataTypes.classes import MeetingTime, Attendance, AttendancePoll, User
 
@@ -12,8 +11,15 @@ from pprint import pprint
 from datetime import datetime
 
 from ...utils.slack import admin_check
+from ...utils.profiles import get_profile
 
-from ...processes.messenger import Messenger
+from ...process import jobRunner
+from ...processes.jobRunner import (
+    ATTENDANCE_POLL,
+    JOB_DESCRIPTIONS,
+    SEND_ATTENDANCE_POLL,
+    job_message,
+)
 
 
 def sayBots(context: BoltContext, client: WebClient, say: Say, logger: Logger):
@@ -111,70 +117,48 @@ def attendancePollTest(
         print(e)
 
 
+# Queues a job and posts the message its progress is shown in
+def start_job(client: WebClient, say: Say, kind: str, payload: dict, user_id: str):
+    job = jobRunner.submit(kind, payload, requested_by=user_id)
+    reply = say(job_message(job, f"{JOB_DESCRIPTIONS[kind]}..."))
+    jobRunner.queue.attach_message(job.id, reply["channel"], reply["ts"])
+    # The job may have finished before its message was posted
+    job = jobRunner.queue.get(job.id)
+    if job.finished is not None:
+        client.chat_update(
+            channel=reply["channel"], ts=reply["ts"], text=job_message(job, job.result)
+        )
+
+
 def attendancePoll(context: BoltContext, client: WebClient, say: Say, logger: Logger):
-    slack_user = client.users_profile_get(user=context["user_id"])
-    first = slack_user["profile"]["first_name"]
-    last = slack_user["profile"]["last_name"]
+    slack_user = get_profile(client, context["user_id"])
+    first = slack_user["first_name"]
+    last = slack_user["last_name"]
 
-    email = slack_user["profile"]["email"]
+    email = slack_user["email"]
     
     admin_status = admin_check(client, context["user_id"])
     if not admin_status:
         say("You are not an admin! You cannot use this command!")
         return
-    
-    user = User(email, first, last)
 
-    spreadsheetController = AttendanceSheetController()
-    spreadsheet_user = spreadsheetController.get_user(user)
-    if spreadsheet_user is None:
-        say("Added you to the attendance sheet")
-        spreadsheet_user = spreadsheetController.lookup_or_add_user(user)
-
-    attendancePoll = spreadsheetController.get_attendance_poll(
-        spreadsheet_user, 5, datetime.now()
+    # The sheet reads run in a job worker, see jobRunner.attendance_poll
+    start_job(
+        client,
+        say,
+        ATTENDANCE_POLL,
+        {"email": email, "first": first, "last": last, "channel": context["channel_id"]},
+        context["user_id"],
     )
-    print("Attendance Poll:", attendancePoll)
-    if attendancePoll is None:
-        say("No more meetings to attend! :tada:")
-        return
-
-    try:
-        json_poll = attendancePoll.generate_slack_poll()
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": "Hi!\n*Select the meetings you will attend:*",
-                },
-            },
-            json_poll,
-        ]
-        print("--------------------")
-        pprint(blocks)
-        say(blocks=blocks)
-    except Exception as e:
-        print(e)
 
 def sendAttendancePoll(context: BoltContext, client: WebClient, say: Say, logger: Logger):
-    MEETING_WINDOW = 4  # Note: Number is inclusive (i.e. 4 means 5 meetings)
-
-    slack_user = client.users_profile_get(user=context["user_id"])
-    first = slack_user["profile"]["first_name"]
-    last = slack_user["profile"]["last_name"]
-
-    email = slack_user["profile"]["email"]
-    
     admin_status = admin_check(client, context["user_id"])
     print("Admin status:", admin_status)
     if not admin_status:
         say("You are not an admin! You cannot use this command!")
         return
-    
-    messenger = Messenger(client)
-    messenger.sendPoll()
-    say("Sent weekly forecast poll!")
+
+    start_job(client, say, SEND_ATTENDANCE_POLL, {}, context["user_id"])
 
     # user = User(email, first, last)
 
@@ -1,6 +1,7 @@
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from .sample_shortcut import sample_shortcut_callback
 
 
 def register(app: App):
-    app.shortcut("sample_shortcut_id")(sample_shortcut_callback)
+    app.shortcut("sample_shortcut_id")(track_handler(sample_shortcut_callback))
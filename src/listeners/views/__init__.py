@@ -1,6 +1,7 @@
 from slack_bolt import App
+from ...utils.metrics import track_handler
 from .sample_view import sample_view_callback
 
 
 def register(app: App):
-    app.view("sample_view_id")(sample_view_callback)
+    app.view("sample_view_id")(track_handler(sample_view_callback))
@@ -1,11 +1,39 @@
-from multiprocessing import Queue
-from .processes.spreadsheetBatcher import SpreadsheetBatcher
+from .processes.spreadsheetBatcher import SpreadsheetBatcherPool
+from .processes.forecastJournal import ForecastJournal
+from .processes.sheetSyncer import SheetSyncer
+from .processes.jobRunner import JobRunnerPool
+from .google.local_store import LOCAL_STORE_ENABLED
+from .utils.metrics import metrics
 
 # from .processes.messenger import Messenger
 
-# Start SpreadsheetThreadPooler as side process
-spreadsheetUpdateQueue = (
-    Queue()
-)  # Queue used to pass Spreadsheet Update Jobs based off of AttendancePolls
-spreadsheetThreadPool = SpreadsheetBatcher(spreadsheetUpdateQueue)
-spreadsheetThreadPool.start()
+# Every ForecastPayload is journaled before it is queued, so nothing is lost if the
+# batcher or the host goes down. The batcher replays the journal when it starts.
+forecastJournal = ForecastJournal()
+
+# Start SpreadsheetThreadPooler as side processes, sharded by user email
+spreadsheetThreadPool = SpreadsheetBatcherPool(journal=forecastJournal)
+
+# Used to pass (journal id, ForecastPayload) Spreadsheet Update Jobs based off of AttendancePolls.
+# put() routes each job to the worker that owns the user.
+spreadsheetUpdateQueue = spreadsheetThreadPool
+
+# With the local store on, the batchers write to SQLite and this process syncs it with the sheet
+sheetSyncer = SheetSyncer() if LOCAL_STORE_ENABLED else None
+
+# Long running message commands (sending the weekly poll, poll test) are queued here and
+# run by worker processes, which post their progress to Slack
+jobRunner = JobRunnerPool()
+
+
+# Called by the app entry points (app.py, async_app.py), not on import. The messenger and
+# scripts import this module too, and a second set of batchers would replay the journal
+# while the app's are still applying it, job recovery would fail the bot's jobs, and two
+# syncers would push the same local changes.
+def start_processes():
+    spreadsheetThreadPool.start()
+    metrics.add_collector(spreadsheetThreadPool.metric_samples)
+    jobRunner.start()
+    metrics.add_collector(jobRunner.metric_samples)
+    if sheetSyncer is not None:
+        sheetSyncer.start()
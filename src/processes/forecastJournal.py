@@ -0,0 +1,209 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+from ..dataTypes.classes import ForecastPayload
+
+# Where queued forecast updates are journaled until they have been written to the sheet
+FORECAST_JOURNAL_PATH = os.environ.get(
+    "FORECAST_JOURNAL_PATH", "data/forecast_journal.sqlite3"
+)
+
+# How long the committer waits for more entries to join a group before committing it
+GROUP_COMMIT_INTERVAL = 0.005  # seconds
+
+# How long append() waits for its entry to be committed. Slack wants the click acked
+# within 3 seconds, so the listener gives up and fails visibly before that.
+APPEND_TIMEOUT = 2.0  # seconds
+
+# Entries that failed this many flushes, or are older than this, can no longer be
+# applied (e.g. their meeting column was removed). They are moved to forecast_journal_dead.
+MAX_ATTEMPTS = 5
+MAX_AGE = 14 * 24 * 60 * 60  # seconds
+
+
+class _PendingEntry:
+    def __init__(self, data: bytes, email: str):
+        self.data = data
+        self.email = email
+        self.id: Optional[int] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class ForecastJournal:
+    """Write-ahead log of ForecastPayloads, kept in SQLite.
+
+    append() returns once the payload is durable. Appends from many threads are committed
+    together by one background thread, so a click only waits for one shared fsync.
+    The batcher calls mark_committed() after the sheet write succeeded, and replays
+    pending_entries() when it starts. Entries keep the user's email, so a commit also
+    drops the user's older entries it supersedes. Entries that keep failing are
+    dead-lettered instead of being replayed on every start.
+    """
+
+    def __init__(
+        self,
+        path: str = FORECAST_JOURNAL_PATH,
+        commit_interval: float = GROUP_COMMIT_INTERVAL,
+    ):
+        self.path = path
+        self.commit_interval = commit_interval
+        self._pending: List[_PendingEntry] = []
+        self._condition = threading.Condition()
+        # Started on the first append, so only the process that appends runs it
+        self._committer: Optional[threading.Thread] = None
+
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS forecast_journal ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "created REAL NOT NULL, "
+                "payload BLOB NOT NULL, "
+                "email TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS forecast_journal_email "
+                "ON forecast_journal (email, id)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS forecast_journal_dead ("
+                "id INTEGER PRIMARY KEY, "
+                "created REAL NOT NULL, "
+                "payload BLOB NOT NULL, "
+                "email TEXT, "
+                "attempts INTEGER NOT NULL, "
+                "dead REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL lets the app append while the batcher reads and deletes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    # One short lived connection per call, committed on success and always closed
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    # Blocks until the payload is committed to disk. Returns its journal id. Raises
+    # TimeoutError if the commit takes longer than timeout seconds.
+    def append(self, payload: ForecastPayload, timeout: float = APPEND_TIMEOUT) -> int:
+        entry = _PendingEntry(pickle.dumps(payload), journal_email(payload))
+        with self._condition:
+            if self._committer is None or not self._committer.is_alive():
+                self._committer = threading.Thread(target=self._commit_loop, daemon=True)
+                self._committer.start()
+            self._pending.append(entry)
+            self._condition.notify()
+
+        if not entry.done.wait(timeout):
+            with self._condition:
+                # Not picked up by the committer yet, so it is never written. An entry that
+                # is already being committed may still be, and is replayed on the next start.
+                if entry in self._pending:
+                    self._pending.remove(entry)
+            raise TimeoutError(f"Forecast journal commit took longer than {timeout}s")
+        if entry.error is not None:
+            raise entry.error
+        return entry.id
+
+    def _commit_loop(self):
+        connection: Optional[sqlite3.Connection] = None
+        while True:
+            with self._condition:
+                while len(self._pending) == 0:
+                    self._condition.wait()
+            # Give other clicks a moment to join this group
+            time.sleep(self.commit_interval)
+            with self._condition:
+                group, self._pending = self._pending, []
+
+            try:
+                if connection is None:
+                    connection = self._connect()
+                with connection:
+                    now = time.time()
+                    for entry in group:
+                        cursor = connection.execute(
+                            "INSERT INTO forecast_journal (created, payload, email) "
+                            "VALUES (?, ?, ?)",
+                            (now, entry.data, entry.email),
+                        )
+                        entry.id = cursor.lastrowid
+            except Exception as e:
+                for entry in group:
+                    entry.error = e
+                # Reconnect for the next group
+                if connection is not None:
+                    connection.close()
+                    connection = None
+            finally:
+                for entry in group:
+                    entry.done.set()
+
+    # Entries that were never marked committed, oldest first
+    def pending_entries(self) -> List[Tuple[int, ForecastPayload]]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, payload FROM forecast_journal ORDER BY id"
+            ).fetchall()
+        return [(id, pickle.loads(payload)) for id, payload in rows]
+
+    # Also drops the older entries of the same users, the committed polls supersede them
+    def mark_committed(self, ids: Iterable[int]):
+        ids = [(id, id) for id in ids]
+        if len(ids) == 0:
+            return
+        with self._transaction() as connection:
+            connection.executemany(
+                "DELETE FROM forecast_journal WHERE id <= ? AND email = "
+                "(SELECT email FROM forecast_journal WHERE id = ?)",
+                ids,
+            )
+
+    # Counts a failed flush of the entries and dead-letters the ones out of attempts
+    def mark_failed(self, ids: Iterable[int], max_attempts: int = MAX_ATTEMPTS) -> int:
+        ids = [(id,) for id in ids]
+        if len(ids) == 0:
+            return 0
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE forecast_journal SET attempts = attempts + 1 WHERE id = ?", ids
+            )
+            return self._dead_letter(connection, "attempts >= ?", (max_attempts,))
+
+    # Dead-letters entries older than max_age seconds. Returns how many were moved.
+    def expire(self, max_age: float = MAX_AGE) -> int:
+        with self._transaction() as connection:
+            return self._dead_letter(connection, "created < ?", (time.time() - max_age,))
+
+    @staticmethod
+    def _dead_letter(connection: sqlite3.Connection, where: str, params: tuple) -> int:
+        connection.execute(
+            "INSERT OR REPLACE INTO forecast_journal_dead "
+            "(id, created, payload, email, attempts, dead) "
+            f"SELECT id, created, payload, email, attempts, ? FROM forecast_journal WHERE {where}",
+            (time.time(),) + params,
+        )
+        return connection.execute(f"DELETE FROM forecast_journal WHERE {where}", params).rowcount
+
+
+def journal_email(payload: ForecastPayload) -> str:
+    return payload.user.email.lower()
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import time
+
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Where background jobs are queued, and kept after they finish for /admin_jobs
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "data/jobs.sqlite3")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    def __init__(
+        self,
+        id: int,
+        kind: str,
+        payload: dict,
+        status: str,
+        requested_by: Optional[str],
+        channel: Optional[str],
+        message_ts: Optional[str],
+        progress: Optional[str],
+        result: Optional[str],
+        created: float,
+        started: Optional[float],
+        finished: Optional[float],
+    ):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.status = status
+        self.requested_by = requested_by  # Slack user id
+        self.channel = channel  # The message progress is posted to
+        self.message_ts = message_ts
+        self.progress = progress
+        self.result = result
+        self.created = created
+        self.started = started
+        self.finished = finished
+
+    @staticmethod
+    def from_row(row: tuple) -> "Job":
+        row = list(row)
+        row[2] = json.loads(row[2])
+        return Job(*row)
+
+
+_COLUMNS = (
+    "id, kind, payload, status, requested_by, channel, message_ts, progress, result, "
+    "created, started, finished"
+)
+
+
+class JobQueue:
+    """Background jobs kept in SQLite, so queued jobs survive a restart.
+
+    Listeners enqueue() and return right away. JobWorkers claim() the oldest queued job,
+    report progress and finish() it. A claim is one UPDATE, so two workers never run the
+    same job.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "kind TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "requested_by TEXT, "
+                "channel TEXT, "
+                "message_ts TEXT, "
+                "progress TEXT, "
+                "result TEXT, "
+                "created REAL NOT NULL, "
+                "started REAL, "
+                "finished REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, kind: str, payload: dict, requested_by: Optional[str] = None) -> int:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO jobs (kind, payload, status, requested_by, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), QUEUED, requested_by, time.time()),
+            )
+            return cursor.lastrowid
+
+    # The Slack message the job's progress is shown in, posted after enqueue()
+    def attach_message(self, id: int, channel: str, message_ts: str):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET channel = ?, message_ts = ? WHERE id = ?",
+                (channel, message_ts, id),
+            )
+
+    def claim(self) -> Optional[Job]:
+        with self._transaction() as connection:
+            row = connection.execute(
+                f"UPDATE jobs SET status = ?, started = ? WHERE id = ("
+                f"SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1) "
+                f"RETURNING {_COLUMNS}",
+                (RUNNING, time.time(), QUEUED),
+            ).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def set_progress(self, id: int, progress: str):
+        with self._transaction() as connection:
+            connection.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, id))
+
+    def finish(self, id: int, status: str, result: str):
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished = ? WHERE id = ?",
+                (status, result, time.time(), id),
+            )
+
+    # Jobs left running by workers that died. They are not retried, a poll may have
+    # been partly sent already.
+    def fail_interrupted(self) -> int:
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished = ? WHERE status = ?",
+                (FAILED, "Interrupted by a restart", time.time(), RUNNING),
+            ).rowcount
+
+    def get(self, id: int) -> Optional[Job]:
+        with self._transaction() as connection:
+            row = connection.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (id,)
+            ).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    # Newest first
+    def recent(self, limit: int) -> List[Job]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                f"SELECT {_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
@@ -0,0 +1,179 @@
+from multiprocessing import Event, Process
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from slack_sdk import WebClient
+
+from ..dataTypes.classes import User
+from ..google.local_store import open_attendance_store
+from ..google.snapshot import DEFAULT_SNAPSHOT_TTL
+from ..utils.metrics import metrics, handler_context
+from .jobQueue import JobQueue, Job, DONE, FAILED, QUEUED, RUNNING
+from .messenger import Messenger
+
+import os
+
+# Number of JobWorker processes in a JobRunnerPool
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Workers are woken up by submit(). Jobs queued by other processes are picked up
+# within this many seconds.
+IDLE_POLL_INTERVAL = 5.0
+
+SEND_ATTENDANCE_POLL = "send_attendance_poll"
+ATTENDANCE_POLL = "attendance_poll"
+
+POLL_WINDOW = 5
+
+# Reports progress by editing the job's Slack message
+Progress = Callable[[str], None]
+
+
+def send_attendance_poll(client: WebClient, payload: dict, progress: Progress) -> str:
+    steps = []
+
+    def report(text: str):
+        steps.append(text)
+        progress(text)
+
+    status = Messenger(client).sendPoll(progress=report)
+    summary = steps[-1] if len(steps) > 0 else "Nothing sent"
+    if status != 0:
+        raise Exception(f"{summary}. See the log for the polls that could not be sent")
+    return f"Sent weekly forecast poll! {summary}"
+
+
+# Posts the requester's own poll for the next POLL_WINDOW meetings
+def attendance_poll(client: WebClient, payload: dict, progress: Progress) -> str:
+    user = User(payload["email"], payload["first"], payload["last"])
+
+    spreadsheetController = open_attendance_store(snapshot_ttl=DEFAULT_SNAPSHOT_TTL)
+    spreadsheet_user = spreadsheetController.get_user(user)
+    if spreadsheet_user is None:
+        progress("Adding you to the attendance sheet")
+        spreadsheet_user = spreadsheetController.lookup_or_add_user(user)
+
+    attendancePoll = spreadsheetController.get_attendance_poll(
+        spreadsheet_user, POLL_WINDOW, datetime.now()
+    )
+    if attendancePoll is None:
+        return "No more meetings to attend! :tada:"
+
+    blocks = [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": "Hi!\n*Select the meetings you will attend:*",
+            },
+        },
+        attendancePoll.generate_slack_poll(),
+    ]
+    client.chat_postMessage(
+        channel=payload["channel"], blocks=blocks, text="Select the meetings you will attend"
+    )
+    return "Posted your attendance poll"
+
+
+JOB_HANDLERS: Dict[str, Callable[[WebClient, dict, Progress], str]] = {
+    SEND_ATTENDANCE_POLL: send_attendance_poll,
+    ATTENDANCE_POLL: attendance_poll,
+}
+
+JOB_DESCRIPTIONS = {
+    SEND_ATTENDANCE_POLL: "Sending the weekly forecast poll",
+    ATTENDANCE_POLL: "Building your attendance poll",
+}
+
+
+def job_message(job: Job, text: str) -> str:
+    return f"Job #{job.id}: {text}"
+
+
+class JobWorker(Process):
+    def __init__(self, queue: JobQueue, wakeup, *args, index: int = 0, **kwargs):
+        super().__init__(*args, daemon=True, **kwargs)
+        self.queue = queue
+        self.wakeup = wakeup
+        self.index = index
+
+    # Edits the job's message. The message may be attached after the job was claimed.
+    def progress(self, job: Job, text: str):
+        self.queue.set_progress(job.id, text)
+        current = self.queue.get(job.id)
+        if current is None or current.message_ts is None:
+            return
+        try:
+            self.client.chat_update(
+                channel=current.channel, ts=current.message_ts, text=job_message(job, text)
+            )
+        except Exception as e:
+            print(f"Could not post progress of job {job.id}:", e)
+
+    def run_job(self, job: Job):
+        print(f"Running job {job.id} ({job.kind})")
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise Exception(f"Unknown job kind {job.kind}")
+            with handler_context(f"Job.{job.kind}"):
+                result = handler(self.client, job.payload, lambda text: self.progress(job, text))
+            status = DONE
+        except Exception as e:
+            print(f"Job {job.id} failed:", e)
+            result = f"Failed: {e}"
+            status = FAILED
+        self.queue.finish(job.id, status, result)
+        self.progress(job, result)
+
+    def run(self):
+        print("Job Worker Started")
+        metrics.reset()
+        metrics.start_exporter(f"jobs-{self.index}")
+        self.client = metrics.wrap_slack(WebClient(token=os.environ.get("SLACK_BOT_TOKEN")))
+        while True:
+            # Cleared before claiming, so a submit() during the claim is not missed
+            self.wakeup.clear()
+            job = self.queue.claim()
+            if job is None:
+                self.wakeup.wait(IDLE_POLL_INTERVAL)
+                continue
+            self.run_job(job)
+
+
+class JobRunnerPool:
+    """JobWorker processes running the jobs of a JobQueue, oldest first.
+
+    Jobs left running when the pool last stopped are marked failed instead of being run
+    again.
+    """
+
+    def __init__(self, queue: Optional[JobQueue] = None, workers: int = JOB_WORKERS):
+        self.queue = queue if queue is not None else JobQueue()
+        self.wakeup = Event()
+        self.workers = [
+            JobWorker(self.queue, self.wakeup, index=i) for i in range(workers)
+        ]
+
+    def start(self):
+        interrupted = self.queue.fail_interrupted()
+        if interrupted > 0:
+            print(f"Marked {interrupted} interrupted jobs as failed")
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, kind: str, payload: dict, requested_by: Optional[str] = None) -> Job:
+        id = self.queue.enqueue(kind, payload, requested_by)
+        self.wakeup.set()
+        return self.queue.get(id)
+
+    # Gauges for metrics.add_collector
+    def metric_samples(self) -> List[tuple]:
+        counts = self.queue.counts()
+        samples = [
+            ("liger_jobs", {"status": status}, counts.get(status, 0))
+            for status in (QUEUED, RUNNING, DONE, FAILED)
+        ]
+        samples.append(
+            ("liger_job_workers_alive", {}, sum(worker.is_alive() for worker in self.workers))
+        )
+        return samples
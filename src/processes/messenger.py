@@ -2,14 +2,18 @@ from multiprocessing import Process
 
 from slack_sdk.web import WebClient
 
-from typing import Dict
-from ..google.sheet_controller import AttendanceSheetController
+from typing import Callable, Dict, List, Optional
+from ..google.local_store import open_attendance_store
+from ..google.sheet_controller import MEETING_TIME_FORMAT_SHORT, status_date
+from ..google.snapshot import DEFAULT_SNAPSHOT_TTL
 from ..dataTypes.classes import User, UserReturn
+from ..utils.fanout import SlackFanout
+from ..utils.profiles import profile_cache
+from ..utils.slack import get_slack_ids
+from ..utils.metrics import metrics, track_handler
+from ..utils.scheduler import JobLog, Scheduler
 
-from datetime import datetime
-
-import json
-import time
+from datetime import datetime, timedelta
 
 # Send slack messages to users when it is time for a meeting based off of the spreadsheet
 # Send poll message every Sunday!
@@ -24,22 +28,53 @@ SEND_DAY = 5  # 0 = Monday, 6 = Sunday
 SEND_HOUR = 14
 SEND_MINUTE = 0
 
+WEEKLY_POLL_JOB = "Messenger.weekly_poll"
+# How far ahead to look for a week with meetings, and how often to look again when
+# the calendar has none (e.g. between seasons)
+MAX_WEEKS_AHEAD = 52
+CALENDAR_RECHECK = timedelta(days=1)
+
+
+# The old minute loop sent any time from SEND_MINUTE until the end of SEND_HOUR
+def in_send_window(date: datetime) -> bool:
+    return date.weekday() == SEND_DAY and date.hour == SEND_HOUR and date.minute >= SEND_MINUTE
+
+
+def send_window_end(date: datetime) -> datetime:
+    return date.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+
+# Start of the first send window after date, or date itself if it is inside one
+def next_send_time(date: datetime) -> datetime:
+    if in_send_window(date):
+        return date
+    days = (SEND_DAY - date.weekday()) % 7
+    send_at = (date + timedelta(days=days)).replace(
+        hour=SEND_HOUR, minute=SEND_MINUTE, second=0, microsecond=0
+    )
+    if send_at <= date:
+        send_at += timedelta(days=7)
+    return send_at
+
+
 class Messenger(Process):
     def __init__(self, client: WebClient):
         print("Messenger process started")
         super().__init__()
         # self.messageQueue = messageQueue
         # self.logger = logger
-        self.client = client
-        self.sheetController = AttendanceSheetController()
+        self.client = metrics.wrap_slack(client)
+        self.fanout = SlackFanout(client)
+        self.sheetController = open_attendance_store(snapshot_ttl=DEFAULT_SNAPSHOT_TTL)
 
-    def sendPoll(self):
+    # progress is called with a short status line at each step, e.g. by a JobWorker
+    @track_handler
+    def sendPoll(self, progress: Optional[Callable[[str], None]] = None):
         print("Sending poll")
+        if progress is None:
+            progress = lambda text: None
         def getMessageList():
-            message_list_id = ""
-            with open("config/slack_ids.json") as f:
-                file = json.load(f)
-                message_list_id = file["MESSAGE_LIST"]
+            message_list_id = get_slack_ids()["MESSAGE_LIST"]
             if message_list_id == "":
                 raise Exception("Message List ID not found in config/slack_ids.json")
 
@@ -50,14 +85,27 @@ class Messenger(Process):
             return message_list["users"]
 
         user_ids = getMessageList()
-        user_profiles = [
-            self.client.users_profile_get(user=x)["profile"] for x in user_ids
-        ]
-        # print(user_profiles)
+        progress(f"Looking up {len(user_ids)} members")
+
+        # Fetch every profile that is not cached concurrently.
+        # Members whose profile could not be fetched are skipped.
+        profiles = {x: profile_cache.lookup(x) for x in user_ids}
+        profile_responses = self.fanout.map(
+            "users.profile.get",
+            {x: {"user": x} for x, profile in profiles.items() if profile is None},
+        )
+        for x, response in profile_responses.results.items():
+            profiles[x] = response["profile"]
+            profile_cache.put(x, response["profile"])
+        for x, error in profile_responses.errors.items():
+            print(f"Could not get profile for {x}: {error}")
+        user_ids = [x for x in user_ids if profiles[x] is not None]
+        user_profiles = [profiles[x] for x in user_ids]
 
         try:
             # str being the user id
             users: Dict[UserReturn, str] = {}
+            roster: List[User] = []
 
             for i in range(len(user_profiles)):
                 # print(user_profiles[i])
@@ -72,6 +120,7 @@ class Messenger(Process):
                         last = split[1]
                     except:
                         first = "NO FIRST NAME GIVEN"
+                        last = ""
 
                 email = user_profiles[i]["email"]
                 id = user_ids[i]
@@ -81,17 +130,23 @@ class Messenger(Process):
                 # print("User is:", user)
                 if user.email == None:
                     raise Exception("User email is None")
-                result = self.sheetController.get_user(user)
-                # print("Result is:", result)
-                if result == None:
-                    result = self.sheetController.add_user(user)
-                    greeting = f"Hi {str(first)}! Welcome to the LigerBot! You've been added to the automatic attendance and forecast system! From now on, I'll be sending you forecasts every Saturday morning, and attendance polls 15 minutes before every meeting."
-                    print(greeting)
-                    self.client.chat_postMessage(channel=id, text=greeting)
                 if id == None:
                     continue
+                roster.append(user)
                 users[user] = id
 
+            # Read the Users sheet once and add everyone missing from it in one write
+            _, added = self.sheetController.reconcile_users(roster)
+            greetings = {}
+            for new_user in added:
+                greeting = f"Hi {str(new_user.first)}! Welcome to the LigerBot! You've been added to the automatic attendance and forecast system! From now on, I'll be sending you forecasts every Saturday morning, and attendance polls 15 minutes before every meeting."
+                print(greeting)
+                greetings[new_user] = {"channel": users[new_user], "text": greeting}
+            self.fanout.map("chat.postMessage", greetings)
+            if len(added) > 0:
+                # The sheet fills in the Forecast rows of new users, re-read it
+                self.sheetController.invalidate_snapshot()
+
             forecasts = self.sheetController.get_forecasts_upcoming_week(
                 date=datetime.now()
             )
@@ -100,8 +155,12 @@ class Messenger(Process):
                 print("No forecasts found. Nothing to send. Exiting.")
                 return 1
 
+            messages = {}
             for user in users:
-                forecast = forecasts[user]
+                forecast = forecasts.get(user)
+                if forecast is None:
+                    print(f"No forecast row for {user}, not sending a poll")
+                    continue
                 id = users[user]
                 json_poll = forecast.generate_slack_poll()
                 blocks = [
@@ -115,37 +174,70 @@ class Messenger(Process):
                     json_poll,
                 ]
 
-                self.client.chat_postMessage(
-                    channel=id,
-                    blocks=blocks,
-                    text="Hi! I was wondering if you could fill out this forecast poll for me? Thanks!",
-                )
+                messages[user] = {
+                    "channel": id,
+                    "blocks": blocks,
+                    "text": "Hi! I was wondering if you could fill out this forecast poll for me? Thanks!",
+                }
+
+            # Post every poll concurrently and report the ones that failed
+            progress(f"Sending {len(messages)} polls")
+            sent = self.fanout.map("chat.postMessage", messages)
+            print(f"Sent {len(sent.results)} polls, {len(sent.errors)} failed")
+            progress(f"Sent {len(sent.results)} polls, {len(sent.errors)} failed")
+            for user, error in sent.errors.items():
+                print(f"Could not send poll to {user}: {error}")
+            if len(sent.errors) > 0:
+                return 1
+            return 0
         except Exception as e:
             print("Error sending poll:", e)
             return 1
             # self.client.chat_postMessage(channel=forecast.user.email, text=f"Hi {forecast.user.first}! Here's your forecast for the next 4 weeks: {forecast.forecast}")
 
+    # First send window with meetings in the week after it, per the meeting calendar
+    def next_poll_time(self, after: datetime) -> datetime:
+        send_at = next_send_time(after)
+        for _ in range(MAX_WEEKS_AHEAD):
+            if len(self.sheetController.get_upcoming_week_meetings(send_at)) > 0:
+                return send_at
+            if self.sheetController.get_nearest_datetime(send_at) is None:
+                break
+            send_at = next_send_time(send_window_end(send_at))
+        # Nothing scheduled yet, look again once meetings may have been added
+        return min(send_at, after + CALENDAR_RECHECK)
+
+    def send_weekly_poll(self, date: datetime):
+        week = status_date(date).strftime(MEETING_TIME_FORMAT_SHORT)
+        if self.job_log.is_done(WEEKLY_POLL_JOB, week):
+            print("Already sent poll")
+            return
+        if len(self.sheetController.get_upcoming_week_meetings(date)) == 0:
+            print("No meetings this week, not sending a poll")
+            return
+        # The Status sheet is still checked once, polls may be sent from another host
+        forecast_sent, _ = self.sheetController.get_success(date=date)
+        if forecast_sent:
+            print("Already sent poll")
+        else:
+            self.sendPoll()
+            self.sheetController.set_success(status_date(date), True, True)
+        self.job_log.mark_done(WEEKLY_POLL_JOB, week)
+
+    def weekly_poll(self) -> datetime:
+        now = datetime.now()
+        if not in_send_window(now):
+            # Woken up to look at the calendar again
+            return self.next_poll_time(now)
+        self.send_weekly_poll(now)
+        return self.next_poll_time(send_window_end(now))
+
     def run(self):
-        while True:
-            date = datetime.now()
-
-            if date.weekday() == SEND_DAY and date.hour == SEND_HOUR and date.minute >= SEND_MINUTE:
-                print("Sending poll")
-                status = self.sheetController.get_success(date =date)
-                print("Getting status")
-                if status[0] == True:
-                    print("Already sent poll")
-                else:
-                    send_status = self.sendPoll()
-                    if send_status == 0:
-                        self.sheetController.set_success(date, True, True)
-                    elif send_status == 1:
-                        self.sheetController.set_success(date, True, True)
-                    else:
-                        self.sheetController.set_success(date, True, True)
-            else:
-                print("Not time to send poll")
-            time.sleep(60)
+        metrics.start_exporter("messenger")
+        self.job_log = JobLog()
+        scheduler = Scheduler()
+        scheduler.add(self.next_poll_time(datetime.now()), WEEKLY_POLL_JOB, self.weekly_poll)
+        scheduler.run()
 
 if __name__ == "__main__":
     from ..app import app
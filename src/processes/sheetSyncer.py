@@ -0,0 +1,54 @@
+from multiprocessing import Process
+
+from ..google.local_store import LocalAttendanceStore
+from ..google.sheet_controller import AttendanceSheetController
+from ..google.snapshot import DEFAULT_SNAPSHOT_TTL
+from ..utils.metrics import metrics, handler_context
+
+import time
+
+# Local writes reach the sheet within PUSH_INTERVAL seconds. Edits made in the sheet
+# reach the local store within PULL_INTERVAL seconds.
+PUSH_INTERVAL = 2.0
+PULL_INTERVAL = 60.0
+
+
+class SheetSyncer(Process):
+    """Keeps the LocalAttendanceStore and the spreadsheet in step.
+
+    Pushes are done before every pull, so a pull never brings back a value the store
+    has already changed.
+    """
+
+    def __init__(
+        self,
+        *args,
+        push_interval: float = PUSH_INTERVAL,
+        pull_interval: float = PULL_INTERVAL,
+        **kwargs
+    ):
+        super().__init__(*args, daemon=True, **kwargs)
+        self.push_interval = push_interval
+        self.pull_interval = pull_interval
+
+    def run(self):
+        print("Sheet Syncer Started")
+        metrics.reset()
+        metrics.start_exporter("sheet-syncer")
+        store = LocalAttendanceStore(
+            AttendanceSheetController(snapshot_ttl=DEFAULT_SNAPSHOT_TTL)
+        )
+        last_pull = time.monotonic()
+        while True:
+            try:
+                with handler_context("SheetSyncer.push"):
+                    pushed = store.push()
+                if pushed > 0:
+                    print(f"Pushed {pushed} local changes to the sheet")
+                if time.monotonic() - last_pull >= self.pull_interval:
+                    with handler_context("SheetSyncer.pull"):
+                        store.pull()
+                    last_pull = time.monotonic()
+            except Exception as e:
+                print("Sheet sync failed:", e)
+            time.sleep(self.push_interval)
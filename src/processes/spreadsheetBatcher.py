@@ -1,66 +1,267 @@
-from multiprocessing import Queue, Process
-from ..dataTypes.classes import User, ForecastJob
-from ..google.sheet_controller import AttendanceSheetController
-from typing import Dict
+from multiprocessing import Queue, Process, Value
+from queue import Empty
+from ..dataTypes.classes import User, ForecastJob, ForecastPayload
+from ..google.local_store import open_attendance_store
+from ..google.snapshot import DEFAULT_SNAPSHOT_TTL
+from .forecastJournal import ForecastJournal, MAX_AGE, MAX_ATTEMPTS
+from ..utils.metrics import metrics, handler_context
+from typing import Dict, List, Optional, Set, Tuple
+
+import time
+import zlib
+
+# A batch is flushed MAX_BATCH_LATENCY seconds after its first job arrives, or as soon
+# as it holds MAX_BATCH_SIZE different users, whichever comes first.
+MAX_BATCH_LATENCY = 2.0
+MAX_BATCH_SIZE = 100
+
+# Number of SpreadsheetBatcher processes in a SpreadsheetBatcherPool
+BATCHER_WORKERS = 4
+
+
+# Stable across processes (unlike hash()), so journal replay lands on the same shard
+def shard_of(email: str, shards: int) -> int:
+    return zlib.crc32(email.lower().encode()) % shards
 
 
 class SpreadsheetBatcher(Process):
-    def __init__(self, queue: Queue, *args, **kwargs):
+    def __init__(
+        self,
+        queue: Queue,
+        *args,
+        max_latency: float = MAX_BATCH_LATENCY,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        journal: Optional[ForecastJournal] = None,
+        shard: Tuple[int, int] = (0, 1),
+        **kwargs
+    ):
         super().__init__(*args, **kwargs)
-        self.queue = queue
-        self.attendancePollController = AttendanceSheetController()
+        self.queue = queue  # Holds (journal id, ForecastPayload) tuples
+        self.journal = journal
+        self.shard = shard  # (this worker's shard, number of shards)
+        # Shared with the parent process for SpreadsheetBatcherPool.stats()
+        self.flushes = Value("i", 0)
+        self.updates = Value("i", 0)
+        self.last_flush_seconds = Value("d", 0.0)
+        self.max_latency = max_latency
+        self.max_batch_size = max_batch_size
+        self.attendancePollController = None  # Opened in run(), in the worker process
 
-    def run(self):
-        print("Spreadsheet Thread Pooler Started")
-        while True:
-            updateBatch: Dict[User, ForecastJob] = {}
+    # Journal ids are tracked per user so superseded entries are committed with the latest one
+    @staticmethod
+    def add_to_batch(
+        batch: Dict[User, ForecastPayload],
+        journal_ids: Dict[User, List[int]],
+        item: Tuple[Optional[int], ForecastPayload],
+    ):
+        journal_id, payload = item
+        ids = journal_ids.get(payload.user, [])
+        # If user is in batch, overwrite their poll with the newer one. Clicks are journaled
+        # and queued in two steps on the listener's threads, so an older click can arrive
+        # second, and only a larger journal id replaces the poll.
+        if journal_id is None or len(ids) == 0 or journal_id > max(ids):
+            batch[payload.user] = payload
+        if journal_id is not None:
+            journal_ids.setdefault(payload.user, []).append(journal_id)
 
-            # Go through all jobs in queue
-            for payload in iter(self.queue.get, None):
-                # Note that self.queue.get() consumes queue items
+    # Waits for a job, then keeps collecting until the batch is old enough or big enough.
+    # Only the latest poll of each user is kept, so repeated clicks become one write.
+    def collect(self) -> Tuple[Dict[User, ForecastPayload], Dict[User, List[int]]]:
+        batch: Dict[User, ForecastPayload] = {}
+        journal_ids: Dict[User, List[int]] = {}
+        self.add_to_batch(batch, journal_ids, self.queue.get())  # Blocks until there is work
+        deadline = time.monotonic() + self.max_latency
 
-                # Rename payload components
-                user = payload.user
-                attendancePoll = payload.poll
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            self.add_to_batch(batch, journal_ids, item)
 
-                # Check if user is not in batch
-                if user not in updateBatch:
+        return batch, journal_ids
 
-                    # Check if user is in sheet
-                    user = self.attendancePollController.lookup_or_add_user(
-                        payload.user
-                    )
-                    # If the user is not in the sheet, add_user will auto add them.
+    # Writes the batch and returns the users whose update did not make it to the sheet
+    def flush(self, batch: Dict[User, ForecastPayload]) -> Set[User]:
+        failed: Set[User] = set()
+        updateBatch: Dict[User, ForecastJob] = {}
 
-                    # Grab the starting column based off of the first date in AttendancePoll
-                    # Note: AttendancePoll is sorted by date (earliest to latest)
+        for payload in batch.values():
+            try:
+                # Check if user is in sheet
+                # If the user is not in the sheet, add_user will auto add them.
+                user = self.attendancePollController.lookup_or_add_user(payload.user)
+                attendancePoll = payload.poll
 
-                    starting_column = self.attendancePollController.get_forecast_entry(
-                        user, attendancePoll.attendances[0].meetingTime.start
-                    )
-                    if starting_column is None:
-                        raise Exception(
-                            f"Could not find starting column for user {user} and date {attendancePoll.attendances[0].meetingTime.start}"
-                        )
-                    starting_column = starting_column.col
-
-                    # Construct ForecastJob to be used by batch update
-                    attendanceJob = ForecastJob(
-                        user=user, poll=attendancePoll, starting_column=starting_column
+                # Grab the starting column based off of the first date in AttendancePoll
+                # Note: AttendancePoll is sorted by date (earliest to latest)
+                # The poll's meeting times are exact, so this is a lookup in the meeting
+                # index and the forecast cell itself is not read
+                starting_column = self.attendancePollController.translate_date_column(
+                    attendancePoll.attendances[0].meetingTime.start
+                )
+                if starting_column is None:
+                    raise Exception(
+                        f"Could not find starting column for user {user} and date {attendancePoll.attendances[0].meetingTime.start}"
                     )
 
-                    # Add new user and their attendance job to batch
-                    updateBatch[user] = attendanceJob
+                # Construct ForecastJob to be used by batch update
+                updateBatch[user] = ForecastJob(
+                    user=user, poll=attendancePoll, starting_column=starting_column
+                )
+            except Exception as e:
+                print(f"Could not prepare forecast update for {payload.user}: {e}")
+                failed.add(payload.user)
+
+        # Submit all changes to sheets
+        failures = self.attendancePollController.batch_update_forecast(updateBatch)
+        for user, error in failures.items():
+            print(f"Could not update forecast for {user}: {error}")
+            failed.add(user)
+        return failed
+
+    # Flushes the batch, then marks the journal entries of every written user as committed.
+    # Failed users stay in the journal and are retried on the next start. A flush that
+    # raises fails every user in the batch.
+    def flush_and_commit(
+        self, batch: Dict[User, ForecastPayload], journal_ids: Dict[User, List[int]]
+    ):
+        start = time.monotonic()
+        try:
+            with handler_context("SpreadsheetBatcher.flush"):
+                failed = self.flush(batch)
+        except Exception as e:
+            print(f"Shard {self.shard[0]}: could not flush forecast updates:", e)
+            failed = set(batch)
+        elapsed = time.monotonic() - start
+        with self.flushes.get_lock():
+            self.flushes.value += 1
+        with self.updates.get_lock():
+            self.updates.value += len(batch)
+        self.last_flush_seconds.value = elapsed
+        shard = {"shard": self.shard[0]}
+        metrics.observe("liger_batcher_flush_seconds", shard, elapsed)
+        if self.journal is None:
+            return
+        self.journal.mark_committed(
+            id
+            for user, ids in journal_ids.items()
+            if user not in failed
+            for id in ids
+        )
+        dead = self.journal.mark_failed(
+            id for user, ids in journal_ids.items() if user in failed for id in ids
+        )
+        if dead > 0:
+            print(f"Gave up on {dead} journaled forecast updates after {MAX_ATTEMPTS} attempts")
+
+    # Re-applies journal entries left over from a crash or restart
+    def replay_journal(self):
+        if self.journal is None:
+            return
+        expired = self.journal.expire()
+        if expired > 0:
+            print(f"Gave up on {expired} journaled forecast updates older than {MAX_AGE}s")
+        shard, shards = self.shard
+        entries = [
+            (journal_id, payload)
+            for journal_id, payload in self.journal.pending_entries()
+            if shard_of(payload.user.email, shards) == shard
+        ]
+        if len(entries) == 0:
+            return
+        print(f"Replaying {len(entries)} journaled forecast updates")
+        batch: Dict[User, ForecastPayload] = {}
+        journal_ids: Dict[User, List[int]] = {}
+        for entry in entries:
+            self.add_to_batch(batch, journal_ids, entry)
+        self.flush_and_commit(batch, journal_ids)
+
+    def run(self):
+        print(f"Spreadsheet Thread Pooler Started (shard {self.shard[0]} of {self.shard[1]})")
+        # Forked from the app, start from clean metrics in this worker's own file
+        metrics.reset()
+        metrics.start_exporter(f"batcher-{self.shard[0]}")
+        # Opened here rather than in __init__, so the parent does not load the sheet (or
+        # pull it into a local store) once per worker. Each worker owns its users' rows,
+        # so its snapshot stays current for them between reloads and is what forecast
+        # writes are diffed against.
+        self.attendancePollController = open_attendance_store(
+            snapshot_ttl=DEFAULT_SNAPSHOT_TTL
+        )
+        self.replay_journal()
+        while True:
+            batch, journal_ids = self.collect()
+            print(f"Shard {self.shard[0]}: flushing {len(batch)} forecast updates")
+            try:
+                self.flush_and_commit(batch, journal_ids)
+            except Exception as e:
+                # The journal could not be updated. The entries are still pending and are
+                # replayed on the next start, keep serving this shard until then.
+                print(f"Shard {self.shard[0]}: could not commit forecast updates:", e)
+
+
+class SpreadsheetBatcherPool:
+    """Several SpreadsheetBatchers, each owning the users whose email hashes to its shard.
+
+    Every update of a user goes through the same worker's queue, so one user's updates stay
+    in order while different users are written in parallel.
+    """
+
+    def __init__(
+        self,
+        workers: int = BATCHER_WORKERS,
+        journal: Optional[ForecastJournal] = None,
+        **kwargs
+    ):
+        self.queues = [Queue() for _ in range(workers)]
+        self.workers = [
+            SpreadsheetBatcher(queue, journal=journal, shard=(i, workers), **kwargs)
+            for i, queue in enumerate(self.queues)
+        ]
 
-                # If user is in batch, overwrite their poll
-                updateBatch[user].poll = attendancePoll
+    def start(self):
+        for worker in self.workers:
+            worker.start()
 
-                # Exit out if queue is empty
-                if self.queue.empty():
-                    break
+    # Takes the same (journal id, ForecastPayload) items as a single batcher's queue
+    def put(self, item: Tuple[Optional[int], ForecastPayload]):
+        _, payload = item
+        self.queues[shard_of(payload.user.email, len(self.queues))].put(item)
 
-            # When queue is empty, submit all changes to sheets
-            self.attendancePollController.batch_update_forecast(updateBatch)
+    def stats(self) -> List[dict]:
+        stats = []
+        for i, (queue, worker) in enumerate(zip(self.queues, self.workers)):
+            try:
+                depth = queue.qsize()
+            except NotImplementedError:  # macOS
+                depth = None
+            stats.append(
+                {
+                    "shard": i,
+                    "alive": worker.is_alive(),
+                    "queue_depth": depth,
+                    "flushes": worker.flushes.value,
+                    "updates": worker.updates.value,
+                    "last_flush_seconds": worker.last_flush_seconds.value,
+                }
+            )
+        return stats
 
-            # Clear batch
-            updateBatch = []
+    # Gauges for metrics.add_collector, read from the workers' shared counters
+    def metric_samples(self) -> List[tuple]:
+        samples = []
+        for entry in self.stats():
+            labels = {"shard": entry["shard"]}
+            samples.append(("liger_batcher_alive", labels, int(entry["alive"])))
+            if entry["queue_depth"] is not None:
+                samples.append(("liger_batcher_queue_depth", labels, entry["queue_depth"]))
+            samples.append(("liger_batcher_flushes", labels, entry["flushes"]))
+            samples.append(("liger_batcher_updates", labels, entry["updates"]))
+            samples.append(
+                ("liger_batcher_last_flush_seconds", labels, entry["last_flush_seconds"])
+            )
+        return samples
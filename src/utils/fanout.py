@@ -0,0 +1,129 @@
+import contextvars
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+# Slack Web API rate limit tiers in requests per minute (https://api.slack.com/docs/rate-limits)
+TIER_1 = 1
+TIER_2 = 20
+TIER_3 = 50
+TIER_4 = 100
+
+# Tier of every method we fan out. chat.postMessage is "special" (about one message per
+# second per channel); every poll goes to a different DM, so it is given a generous limit.
+METHOD_TIERS = {
+    "users.profile.get": TIER_4,
+    "usergroups.users.list": TIER_2,
+    "chat.postMessage": 600,
+    "chat.update": TIER_3,
+}
+DEFAULT_TIER = TIER_3
+
+MAX_WORKERS = 8
+MAX_RETRIES = 3
+
+
+class MethodRateLimiter:
+    """In-process token bucket for one Slack method.
+
+    The bucket holds a minute's worth of calls, so short bursts go through immediately.
+    """
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    # Slack told us to back off, so drain the bucket for that long
+    def pause(self, seconds: float):
+        with self.lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.updated = time.monotonic()
+
+
+@dataclass
+class FanoutResult:
+    results: Dict[Hashable, Any] = field(default_factory=dict)
+    errors: Dict[Hashable, Exception] = field(default_factory=dict)
+
+
+class SlackFanout:
+    """Runs many calls to the same Slack method on a bounded thread pool.
+
+    Calls respect the method's rate tier and Slack's Retry-After header, and every
+    key's response or error is collected so one failure never stops the rest.
+    """
+
+    def __init__(self, client: WebClient, max_workers: int = MAX_WORKERS):
+        self.client = client
+        self.max_workers = max_workers
+        self.limiters: Dict[str, MethodRateLimiter] = {}
+        self.limiters_lock = threading.Lock()
+
+    def limiter(self, method: str) -> MethodRateLimiter:
+        with self.limiters_lock:
+            if method not in self.limiters:
+                self.limiters[method] = MethodRateLimiter(
+                    METHOD_TIERS.get(method, DEFAULT_TIER)
+                )
+            return self.limiters[method]
+
+    # method is the Slack method name, e.g. "chat.postMessage"
+    def call(self, method: str, **kwargs):
+        limiter = self.limiter(method)
+        client_method = getattr(self.client, method.replace(".", "_"))
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                return client_method(**kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= MAX_RETRIES:
+                    raise
+                retry_after = float(e.response.headers.get("Retry-After", 1))
+                print(f"Slack rate limited {method}, retrying in {retry_after}s")
+                limiter.pause(retry_after)
+                attempt += 1
+
+    # Calls method once per key with that key's arguments
+    def map(self, method: str, calls: Dict[Hashable, Dict[str, Any]]) -> FanoutResult:
+        result = FanoutResult()
+        if len(calls) == 0:
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Each call runs in a copy of the caller's context, so metrics keep the handler
+            futures = {
+                key: executor.submit(
+                    contextvars.copy_context().run, self.call, method, **kwargs
+                )
+                for key, kwargs in calls.items()
+            }
+            for key, future in futures.items():
+                try:
+                    result.results[key] = future.result()
+                except Exception as e:
+                    result.errors[key] = e
+        return result
@@ -0,0 +1,290 @@
+import os
+import re
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Every process writes its metrics to METRICS_DIR/<role>.prom in the Prometheus text
+# format, for node_exporter's textfile collector and for /admin_metrics
+METRICS_DIR = os.environ.get("METRICS_DIR", "data/metrics")
+EXPORT_INTERVAL = 15  # seconds
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Labels are kept as sorted (name, value) tuples so they can be dict keys
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+# Name of the listener or job an API call is made for
+_handler: ContextVar[str] = ContextVar("metrics_handler", default="unknown")
+
+
+def current_handler() -> str:
+    return _handler.get()
+
+
+@contextmanager
+def handler_context(name: str):
+    token = _handler.set(name)
+    try:
+        yield
+    finally:
+        _handler.reset(token)
+
+
+# Tags every API call made while fn runs with fn's qualified name
+def track_handler(fn: Callable) -> Callable:
+    name = fn.__qualname__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with handler_context(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def to_labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: Labels) -> str:
+    if len(labels) == 0:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms of one process.
+
+    wrap_sheets(), wrap_slack() and wrap_async_slack() time every Sheets and Slack API
+    call and tag it with the method and the handler that made it. Collectors are called
+    on every render to add gauges that are cheaper to read on demand (like queue depths).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._exporter: Optional[threading.Thread] = None
+        self.export_path: Optional[str] = None
+
+    # Drops everything, e.g. in a child process that inherited its parent's metrics
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.collectors = []
+
+    def inc(self, name: str, labels: Dict[str, str], amount: float = 1):
+        key = to_labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name: str, labels: Dict[str, str], value: float):
+        with self.lock:
+            self.gauges.setdefault(name, {})[to_labels(labels)] = value
+
+    def observe(self, name: str, labels: Dict[str, str], value: float):
+        key = to_labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    # Adding the same collector again does nothing
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        with self.lock:
+            if collector not in self.collectors:
+                self.collectors.append(collector)
+
+    # Runs call and records it as one call of an API method
+    def time_call(self, api: str, method: str, call: Callable):
+        labels = {"api": api, "method": method, "handler": current_handler()}
+        start = time.perf_counter()
+        try:
+            return call()
+        except Exception:
+            self.inc("liger_api_errors_total", labels)
+            raise
+        finally:
+            self.inc("liger_api_calls_total", labels)
+            self.observe("liger_api_call_seconds", labels, time.perf_counter() - start)
+
+    async def time_async_call(self, api: str, method: str, call: Callable):
+        labels = {"api": api, "method": method, "handler": current_handler()}
+        start = time.perf_counter()
+        try:
+            return await call()
+        except Exception:
+            self.inc("liger_api_errors_total", labels)
+            raise
+        finally:
+            self.inc("liger_api_calls_total", labels)
+            self.observe("liger_api_call_seconds", labels, time.perf_counter() - start)
+
+    # Hooks the client's SheetAPIWrapper._execute_requests like sheets_quota does. Wrap
+    # before the quota so the time spent waiting for quota is not counted as latency.
+    def wrap_sheets(self, gc):
+        sheet = gc.sheet
+        execute = sheet._execute_requests
+
+        def _execute_requests(request):
+            # googleapiclient requests carry the API method id, the fake's carry method
+            method = getattr(request, "methodId", None) or getattr(request, "method", "unknown")
+            if method.startswith("sheets."):
+                method = method[len("sheets.") :]
+            return self.time_call("sheets", method, lambda: execute(request))
+
+        sheet._execute_requests = _execute_requests
+        return gc
+
+    # Every WebClient method goes through api_call. Safe to call more than once.
+    def wrap_slack(self, client):
+        if getattr(client, "_metrics_wrapped", False):
+            return client
+        api_call = client.api_call
+
+        @wraps(api_call)
+        def wrapped_api_call(api_method: str, *args, **kwargs):
+            return self.time_call(
+                "slack", api_method, lambda: api_call(api_method, *args, **kwargs)
+            )
+
+        client.api_call = wrapped_api_call
+        client._metrics_wrapped = True
+        return client
+
+    # Same for AsyncWebClient, whose api_call is a coroutine
+    def wrap_async_slack(self, client):
+        if getattr(client, "_metrics_wrapped", False):
+            return client
+        api_call = client.api_call
+
+        @wraps(api_call)
+        async def wrapped_api_call(api_method: str, *args, **kwargs):
+            return await self.time_async_call(
+                "slack", api_method, lambda: api_call(api_method, *args, **kwargs)
+            )
+
+        client.api_call = wrapped_api_call
+        client._metrics_wrapped = True
+        return client
+
+    def render(self) -> str:
+        collected: List[Sample] = []
+        for collector in list(self.collectors):
+            try:
+                collected.extend(collector())
+            except Exception as e:
+                print("Metrics collector failed:", e)
+
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+            gauges: Dict[str, Dict[Labels, float]] = {
+                name: dict(series) for name, series in self.gauges.items()
+            }
+            for name, labels, value in collected:
+                gauges.setdefault(name, {})[to_labels(labels)] = value
+            for name, series in sorted(gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        bucket_labels = labels + (("le", bound),)
+                        lines.append(f"{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    # Writes atomically, so readers never see a half written file
+    def write_textfile(self, path: str):
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.render())
+        os.replace(temporary, path)
+
+    # Exports this process's metrics to METRICS_DIR/<role>.prom every interval seconds
+    def start_exporter(self, role: str, directory: str = METRICS_DIR, interval: float = EXPORT_INTERVAL):
+        path = os.path.join(directory, f"{role}.prom")
+        self.export_path = path
+
+        def export_loop():
+            while True:
+                try:
+                    self.write_textfile(path)
+                except Exception as e:
+                    print("Could not export metrics:", e)
+                time.sleep(interval)
+
+        self._exporter = threading.Thread(target=export_loop, daemon=True)
+        self._exporter.start()
+
+
+metrics = MetricsRegistry()
+
+_SAMPLE_LINE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# Reads every .prom file in directory and sums the same series across processes
+def read_textfiles(directory: str = METRICS_DIR) -> Dict[Tuple[str, Labels], float]:
+    samples: Dict[Tuple[str, Labels], float] = {}
+    if not os.path.isdir(directory):
+        return samples
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".prom"):
+            continue
+        with open(os.path.join(directory, filename)) as f:
+            for line in f:
+                match = _SAMPLE_LINE.match(line.strip())
+                if match is None:
+                    continue
+                name, labels, value = match.groups()
+                labels = tuple(sorted(_LABEL.findall(labels or "")))
+                key = (name, labels)
+                samples[key] = samples.get(key, 0) + float(value)
+    return samples
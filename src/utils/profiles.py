@@ -0,0 +1,49 @@
+import threading
+
+from typing import Optional
+
+from cachetools import TTLCache
+from slack_sdk import WebClient
+
+# Profiles are also dropped as soon as Slack tells us they changed (see events/user_change.py)
+PROFILE_CACHE_TTL = 60 * 60  # seconds
+PROFILE_CACHE_SIZE = 1024
+
+
+class ProfileCache:
+    """Slack user profiles keyed by user id, bounded by size and age."""
+
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE, ttl: float = PROFILE_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # TTLCache is not thread safe and Bolt runs listeners on a thread pool
+        self.lock = threading.Lock()
+
+    # Cached profile, or None if it is not cached
+    def lookup(self, user_id: str) -> Optional[dict]:
+        with self.lock:
+            return self.cache.get(user_id)
+
+    def put(self, user_id: str, profile: dict):
+        with self.lock:
+            self.cache[user_id] = profile
+
+    def invalidate(self, user_id: str):
+        with self.lock:
+            self.cache.pop(user_id, None)
+
+    # Returns the "profile" part of users.profile.get, only calling Slack on a miss
+    def get(self, client: WebClient, user_id: str) -> dict:
+        profile = self.lookup(user_id)
+        if profile is None:
+            # User profiles searchable by user id (https://api.slack.com/methods/users.profile.get)
+            profile = client.users_profile_get(user=user_id)["profile"]
+            self.put(user_id, profile)
+        return profile
+
+
+# Shared by every listener and the Messenger in this process
+profile_cache = ProfileCache()
+
+
+def get_profile(client: WebClient, user_id: str) -> dict:
+    return profile_cache.get(client, user_id)
@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from .metrics import handler_context
+
+# Where the scheduler remembers which runs of its jobs are done, across restarts
+JOB_LOG_PATH = os.environ.get("JOB_LOG_PATH", "data/scheduler.sqlite3")
+
+# Longest single sleep, so a changed wall clock (DST, NTP, suspend) is noticed in time
+MAX_SLEEP = 3600  # seconds
+# A job that raised runs again after this long
+RETRY_DELAY = timedelta(minutes=5)
+
+# Runs a job and returns when it should run next, or None to drop it
+JobAction = Callable[[], Optional[datetime]]
+
+
+class ScheduledJob:
+    def __init__(self, fire_at: datetime, sequence: int, name: str, action: JobAction):
+        self.fire_at = fire_at
+        self.sequence = sequence
+        self.name = name
+        self.action = action
+
+    # Earliest first, jobs due at the same time in the order they were added
+    def __lt__(self, other: "ScheduledJob") -> bool:
+        return (self.fire_at, self.sequence) < (other.fire_at, other.sequence)
+
+
+class Scheduler:
+    """Runs jobs at wall clock times, sleeping until the earliest one is due.
+
+    Pending jobs are kept in a heap, so the loop only wakes up when a job fires (or
+    after MAX_SLEEP), instead of polling the sheet on a timer. Each job's action returns
+    the time it should fire next. Jobs may be added from other threads.
+    """
+
+    def __init__(self):
+        self.jobs: List[ScheduledJob] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def add(self, fire_at: datetime, name: str, action: JobAction):
+        with self._condition:
+            heapq.heappush(self.jobs, ScheduledJob(fire_at, next(self._sequence), name, action))
+            self._condition.notify()
+        print(f"Scheduled {name} at {fire_at}")
+
+    def next_fire_time(self) -> Optional[datetime]:
+        with self._condition:
+            return self.jobs[0].fire_at if len(self.jobs) > 0 else None
+
+    # Waits until the earliest job is due and pops it
+    def wait_for_job(self) -> ScheduledJob:
+        with self._condition:
+            while True:
+                if len(self.jobs) == 0:
+                    self._condition.wait()
+                    continue
+                delay = (self.jobs[0].fire_at - datetime.now()).total_seconds()
+                if delay <= 0:
+                    return heapq.heappop(self.jobs)
+                self._condition.wait(min(delay, MAX_SLEEP))
+
+    def fire(self, job: ScheduledJob):
+        start = time.monotonic()
+        try:
+            with handler_context(job.name):
+                fire_at = job.action()
+        except Exception as e:
+            print(f"Scheduled job {job.name} failed:", e)
+            fire_at = datetime.now() + RETRY_DELAY
+        print(f"Ran {job.name} in {time.monotonic() - start:.1f}s")
+        if fire_at is not None:
+            self.add(fire_at, job.name, job.action)
+
+    def run(self):
+        while True:
+            self.fire(self.wait_for_job())
+
+
+class JobLog:
+    """Remembers which runs of scheduled jobs are done, keyed by job name and run key.
+
+    Lets a restarted process skip work it already did without asking the sheet.
+    """
+
+    def __init__(self, path: str = JOB_LOG_PATH):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_runs ("
+                "job TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "done REAL NOT NULL, "
+                "PRIMARY KEY (job, key))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def is_done(self, job: str, key: str) -> bool:
+        with self._transaction() as connection:
+            return (
+                connection.execute(
+                    "SELECT 1 FROM job_runs WHERE job = ? AND key = ?", (job, key)
+                ).fetchone()
+                is not None
+            )
+
+    def mark_done(self, job: str, key: str):
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO job_runs (job, key, done) VALUES (?, ?, ?)",
+                (job, key, time.time()),
+            )
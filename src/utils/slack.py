@@ -1,12 +1,19 @@
 import json
+import threading
+from functools import lru_cache
 from ..dataTypes.classes import UserCreate
 
 from logging import Logger
 
+from cachetools import TTLCache
 from slack_bolt import Ack
 from slack_sdk import WebClient
 from ..dataTypes.classes import User
 
+# Usergroup members are also dropped when Slack sends subteam_members_changed
+USERGROUP_CACHE_TTL = 5 * 60  # seconds
+USERGROUP_CACHE_SIZE = 64
+
 # def admin_check(user: UserCreate) -> bool:
 #     """Check if user is admin"""
 
@@ -16,12 +23,40 @@ from ..dataTypes.classes import User
 #         return False
 
 
-def admin_check(client: WebClient, user_id: str) -> bool:
-    """Check if user is admin"""
+@lru_cache(maxsize=None)
+def get_slack_ids() -> dict:
+    """Load config/slack_ids.json once per process"""
     with open("config/slack_ids.json", "r") as f:
-        slack_ids = json.load(f)
+        return json.load(f)
+
+
+class UsergroupCache:
+    """Members of Slack usergroups, keyed by usergroup id"""
+
+    def __init__(self, maxsize: int = USERGROUP_CACHE_SIZE, ttl: float = USERGROUP_CACHE_TTL):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+
+    def get(self, client: WebClient, usergroup: str) -> frozenset:
+        with self.lock:
+            members = self.cache.get(usergroup)
+        if members is None:
+            members = frozenset(client.usergroups_users_list(usergroup=usergroup)["users"])
+            with self.lock:
+                self.cache[usergroup] = members
+        return members
 
-    admins = client.usergroups_users_list(usergroup=slack_ids["ADMIN_LIST"])["users"]
+    def invalidate(self, usergroup: str):
+        with self.lock:
+            self.cache.pop(usergroup, None)
+
+
+usergroup_cache = UsergroupCache()
+
+
+def admin_check(client: WebClient, user_id: str) -> bool:
+    """Check if user is admin"""
+    admins = usergroup_cache.get(client, get_slack_ids()["ADMIN_LIST"])
 
     if user_id in admins:
         return True